@@ -3,11 +3,12 @@ from __future__ import annotations
 from typing import Optional, Tuple, TYPE_CHECKING
 
 import color
+from entity import Item
 import exceptions
 
 if TYPE_CHECKING:
     from engine import Engine
-    from entity import Actor, Entity, Item
+    from entity import Actor, Entity
 
 class Action:
     def __init__(self, entity: Actor) -> None:
@@ -46,12 +47,14 @@ class PickupAction(Action):
         actor_location_y = self.entity.y
         inventory = self.entity.inventory
 
-        for item in self.engine.game_map.items:
-            if actor_location_x == item.x and actor_location_y == item.y:
+        for item in self.engine.game_map.get_entities_at_location(
+            actor_location_x, actor_location_y
+        ):
+            if isinstance(item, Item):
                 if len(inventory.items) >= inventory.capacity:
                     raise exceptions.Impossible("Your inventory is full.")
                 
-                self.engine.game_map.entities.remove(item)
+                self.engine.game_map.remove_entity(item)
                 item.parent = self.entity.inventory
                 inventory.items.append(item)
 
@@ -96,17 +99,26 @@ class TakeStairsAction(Action):
         """
         Traverse stairs if any exist at entity's location
         """
-        if (self.entity.x, self.entity.y) == self.engine.game_map.downstairs_location:
-            self.engine.game_world.generate_floor()
+        location = (self.entity.x, self.entity.y)
+        if location == self.engine.game_map.downstairs_location:
+            self.engine.game_world.descend()
             self.engine.message_log.add_message(
                 "You descend into the unknown.", color.descend
             )
+        elif (
+            location == self.engine.game_map.upstairs_location
+            and self.engine.game_world.current_floor > 1
+        ):
+            self.engine.game_world.ascend()
+            self.engine.message_log.add_message(
+                "You climb back up the stairs.", color.descend
+            )
         else:
             self.engine.message_log.add_message(
                 f"Stairs: {self.engine.game_map.downstairs_location}, Player: {(self.engine.player.x, self.engine.player.y)}",
                 color.debug
             )
-            raise exceptions.Impossible("There is no way down here.")
+            raise exceptions.Impossible("There are no stairs here.")
 
 
 class ActionWithDirection(Action):
@@ -157,7 +169,7 @@ class MeleeAction(ActionWithDirection):
             self.engine.message_log.add_message(
                 f"{attack_desc} for {damage} hit points.", attack_color
             )
-            target.fighter.hp -= damage
+            target.fighter.take_damage(damage)
         else:
             self.engine.message_log.add_message(
                 f"{attack_desc} but does no damage.", attack_color
@@ -171,9 +183,9 @@ class MovementAction(ActionWithDirection):
 
         if not self.engine.game_map.in_bounds(dest_x, dest_y):
             raise exceptions.Impossible("That way is blocked.") # Destination out of bounds
-        if not self.engine.game_map.tiles["walkable"][dest_x, dest_y]:
+        if not self.engine.game_map.walkable[dest_x, dest_y]:
             raise exceptions.Impossible("That way is blocked.") # Destination blocked by tile
-        if self.engine.game_map.get_blocking_entity_at_location(dest_x, dest_y):
+        if self.engine.game_map.blocked[dest_x, dest_y]:
             raise exceptions.Impossible("That way is blocked.") # Destination is blocked by an entity
         
         self.entity.move(self.dx, self.dy)
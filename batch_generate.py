@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Generate many seeded floors without a window and report statistics.
+
+Floor N of a batch is the same floor N a game started with the same seed
+generates, so an interesting floor can be looked at in the game.
+
+    python batch_generate.py --floors 1000 --seed 1234 --archive floors.npz
+"""
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import random
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+import tcod
+
+from engine import Engine
+from entity import Actor, Item
+import entity_factories
+from procgen import generate, GENERATORS
+
+
+class FloorStats(NamedTuple):
+    floor: int
+    seconds: float
+    rooms: int
+    walkable_fraction: float
+    monsters: int
+    items: int
+    # Walkable regions before the generator joined them
+    regions: int
+    carved_tiles: int
+    # Fraction of walkable tiles reachable from the upstairs
+    connected_fraction: float
+    stairs_reachable: bool
+    # Set when the floor is archived
+    tiles: Optional[np.ndarray] = None
+    entities: Optional[np.ndarray] = None
+    entity_names: Optional[np.ndarray] = None
+
+
+def generate_floor(
+    floor: int, seed: int, settings: Dict[str, Any], keep_tiles: bool
+) -> FloorStats:
+    """Generate one floor and measure it, runs in a worker process"""
+    engine = Engine(player=copy.deepcopy(entity_factories.player), seed=seed)
+
+    start = time.perf_counter()
+    dungeon = generate(engine=engine, rng=engine.rng.floor(floor), **settings)
+    seconds = time.perf_counter() - start
+
+    dungeon.remove_entity(engine.player)
+    entities = sorted(dungeon.entities, key=lambda entity: (entity.x, entity.y, entity.name))
+
+    # Measured over the whole floor, which makes every chunk of a chunked one
+    walkable = np.asarray(dungeon.walkable)
+    # Distances from the upstairs, unreachable tiles keep the maximum value
+    distance = tcod.path.maxarray(walkable.shape, dtype=np.int32, order="F")
+    distance[dungeon.upstairs_location] = 0
+    tcod.path.dijkstra2d(distance, walkable, 1, 1, out=distance)
+    reachable = distance != np.iinfo(np.int32).max
+    walkable_count = int(walkable.sum())
+
+    stats = FloorStats(
+        floor=floor,
+        seconds=seconds,
+        rooms=dungeon.room_count,
+        walkable_fraction=walkable_count / walkable.size,
+        monsters=sum(isinstance(entity, Actor) for entity in entities),
+        items=sum(isinstance(entity, Item) for entity in entities),
+        regions=dungeon.connectivity.regions,
+        carved_tiles=dungeon.connectivity.carved_tiles,
+        connected_fraction=int(reachable.sum()) / max(walkable_count, 1),
+        stairs_reachable=bool(reachable[dungeon.downstairs_location]),
+    )
+    if keep_tiles:
+        stats = stats._replace(
+            tiles=np.asarray(dungeon.tiles),
+            entities=np.array([(e.x, e.y) for e in entities], dtype=np.int16).reshape(-1, 2),
+            entity_names=np.array([e.name for e in entities], dtype=str),
+        )
+    return stats
+
+
+def write_archive(path: str, seed: int, settings: Dict[str, Any], results: List[FloorStats]) -> None:
+    """
+    Write the floors to a compressed .npz archive.
+    Floor N is stored as tiles_N, entities_N (x, y rows) and entity_names_N.
+    """
+    arrays: Dict[str, np.ndarray] = {
+        "seed": np.array(seed),
+        "floors": np.array([stats.floor for stats in results]),
+        "settings": np.array(sorted(settings.items()), dtype=str),
+    }
+    for stats in results:
+        arrays[f"tiles_{stats.floor}"] = stats.tiles
+        arrays[f"entities_{stats.floor}"] = stats.entities
+        arrays[f"entity_names_{stats.floor}"] = stats.entity_names
+    np.savez_compressed(path, **arrays)
+
+
+def print_summary(results: List[FloorStats]) -> None:
+    milliseconds = np.array([stats.seconds for stats in results]) * 1000
+
+    def describe(name: str, values: np.ndarray, unit: str = "") -> None:
+        print(
+            f"{name:>18}: mean {values.mean():.2f}{unit}, min {values.min():.2f}{unit}, "
+            f"median {np.median(values):.2f}{unit}, max {values.max():.2f}{unit}"
+        )
+
+    print(f"{len(results)} floors")
+    describe("generation time", milliseconds, " ms")
+    describe("rooms", np.array([stats.rooms for stats in results]))
+    describe("walkable", np.array([stats.walkable_fraction for stats in results]) * 100, "%")
+    describe("monsters", np.array([stats.monsters for stats in results]))
+    describe("items", np.array([stats.items for stats in results]))
+    describe("regions", np.array([stats.regions for stats in results]))
+    describe("carved tiles", np.array([stats.carved_tiles for stats in results]))
+    describe("connected", np.array([stats.connected_fraction for stats in results]) * 100, "%")
+    disconnected = [stats.floor for stats in results if stats.connected_fraction < 1]
+    unreachable = [stats.floor for stats in results if not stats.stairs_reachable]
+    print(f"{'disconnected':>18}: {len(disconnected)} floors {disconnected[:20]}")
+    print(f"{'stairs unreachable':>18}: {len(unreachable)} floors {unreachable[:20]}")
+
+
+def main() -> None:
+    # Defaults match setup_game.new_game
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--floors", type=int, default=100, help="number of floors to generate")
+    parser.add_argument("--first-floor", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None, help="world seed, random by default")
+    parser.add_argument("--generator", choices=GENERATORS, default="rooms")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per CPU by default")
+    parser.add_argument("--map-width", type=int, default=80)
+    parser.add_argument("--map-height", type=int, default=43)
+    parser.add_argument("--max-rooms", type=int, default=30)
+    parser.add_argument("--room-min-size", type=int, default=6)
+    parser.add_argument("--room-max-size", type=int, default=10)
+    parser.add_argument("--max-monsters-per-room", type=int, default=2)
+    parser.add_argument("--max-items-per-room", type=int, default=2)
+    parser.add_argument(
+        "--sample-free-space", action="store_true", help="place rooms in free space, rooms generator only"
+    )
+    parser.add_argument("--archive", metavar="PATH", help="write the floors to a .npz archive")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+    if args.sample_free_space and args.generator != "rooms":
+        parser.error("--sample-free-space only works with --generator rooms")
+
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+    settings: Dict[str, Any] = dict(
+        generator=args.generator,
+        max_rooms=args.max_rooms,
+        room_min_size=args.room_min_size,
+        room_max_size=args.room_max_size,
+        map_width=args.map_width,
+        map_height=args.map_height,
+        max_monsters_per_room=args.max_monsters_per_room,
+        max_items_per_room=args.max_items_per_room,
+    )
+    if args.sample_free_space:
+        settings["sample_free_space"] = True
+    floors = range(args.first_floor, args.first_floor + args.floors)
+    keep_tiles = args.archive is not None
+
+    print(f"seed {seed}")
+    start = time.perf_counter()
+    results: List[FloorStats] = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for stats in executor.map(
+            generate_floor,
+            floors,
+            [seed] * len(floors),
+            [settings] * len(floors),
+            [keep_tiles] * len(floors),
+            chunksize=max(1, len(floors) // 64),
+        ):
+            results.append(stats)
+            if not args.quiet:
+                print(
+                    f"floor {stats.floor}: {stats.seconds * 1000:.2f} ms, "
+                    f"{stats.rooms} rooms, {stats.walkable_fraction:.1%} walkable, "
+                    f"{stats.monsters} monsters, {stats.items} items, "
+                    f"{stats.regions} regions, {stats.carved_tiles} tiles carved, "
+                    f"{stats.connected_fraction:.1%} connected"
+                    + ("" if stats.stairs_reachable else ", stairs unreachable")
+                )
+    elapsed = time.perf_counter() - start
+
+    print_summary(results)
+    print(f"{'wall time':>18}: {elapsed:.2f} s")
+    if args.archive:
+        write_archive(args.archive, seed, settings, results)
+        print(f"Floors written to {args.archive}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+
+# Width and height of a chunk in tiles
+CHUNK_SIZE = 64
+
+
+class ChunkedArray:
+    """
+    A 2D array stored as square chunks of CHUNK_SIZE tiles, which are only
+    allocated when they are first written to. If a `generate` function is
+    given, a chunk is instead made by calling it with the chunk's position
+    when the chunk is first read or written, and it must return an array of
+    the chunk's full size.
+
+    Supports the indexing GameMap uses on its tile arrays: an (x, y)
+    position, a pair of slices, and a pair of x and y index arrays.
+    Reading slices or index arrays returns a new dense array, so changes
+    to it must be written back.
+    """
+
+    ndim = 2
+
+    def __init__(
+            self,
+            shape: Tuple[int, int],
+            dtype: Any,
+            fill_value: Any,
+            chunk_size: int = CHUNK_SIZE,
+            generate: Optional[Callable[[int, int], np.ndarray]] = None,
+    ):
+        self.shape = int(shape[0]), int(shape[1])
+        self.dtype = np.dtype(dtype)
+        self.fill_value = self.dtype.type(fill_value)
+        self.chunk_size = chunk_size
+        self.generate = generate
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = {}
+
+
+    @property
+    def size(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the allocated chunks"""
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+
+    def chunk(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        """Return the chunk at the given chunk position, making it if needed"""
+        chunk = self.chunks.get((chunk_x, chunk_y))
+        if chunk is None:
+            size = self.chunk_size
+            if self.generate is None:
+                chunk = np.full((size, size), self.fill_value, dtype=self.dtype, order="F")
+            else:
+                chunk = np.asfortranarray(self.generate(chunk_x, chunk_y), dtype=self.dtype)
+                if chunk.shape != (size, size):
+                    raise ValueError(
+                        f"Generated chunk has shape {chunk.shape}, expected {(size, size)}"
+                    )
+            self.chunks[chunk_x, chunk_y] = chunk
+        return chunk
+
+
+    def _read_chunk(self, chunk_x: int, chunk_y: int) -> Optional[np.ndarray]:
+        """Return a chunk to read, or None if it is unallocated and all fill_value"""
+        if self.generate is None:
+            return self.chunks.get((chunk_x, chunk_y))
+        return self.chunk(chunk_x, chunk_y)
+
+
+    def __array__(self, dtype: Any = None, copy: Optional[bool] = None) -> np.ndarray:
+        """Return the whole array as a dense array"""
+        array = self[:, :]
+        return array if dtype is None else array.astype(dtype)
+
+
+    def __getitem__(self, index: Tuple[Any, Any]) -> Any:
+        kind, x, y = self._parse_index(index)
+        size = self.chunk_size
+        if kind == "position":
+            chunk = self._read_chunk(x // size, y // size)
+            return self.fill_value if chunk is None else chunk[x % size, y % size]
+
+        if kind == "points":
+            shape = x.shape
+            x, y = x.ravel(), y.ravel()
+            result = np.full(x.size, self.fill_value, dtype=self.dtype)
+            for chunk_x, chunk_y, selected in self._group_points(x, y):
+                chunk = self._read_chunk(chunk_x, chunk_y)
+                if chunk is not None:
+                    result[selected] = chunk[x[selected] % size, y[selected] % size]
+            return result.reshape(shape)
+
+        (x1, x2, drop_x), (y1, y2, drop_y) = x, y
+        result = np.full((x2 - x1, y2 - y1), self.fill_value, dtype=self.dtype, order="F")
+        for chunk_x, chunk_y, area, chunk_area in self._overlapping_chunks(x1, x2, y1, y2):
+            chunk = self._read_chunk(chunk_x, chunk_y)
+            if chunk is not None:
+                result[area] = chunk[chunk_area]
+        # Axes indexed by an integer are dropped, as numpy does
+        return result[0 if drop_x else slice(None), 0 if drop_y else slice(None)]
+
+
+    def __setitem__(self, index: Tuple[Any, Any], value: Any) -> None:
+        kind, x, y = self._parse_index(index)
+        size = self.chunk_size
+        if kind == "position":
+            self.chunk(x // size, y // size)[x % size, y % size] = value
+            return
+
+        if kind == "points":
+            values = np.broadcast_to(np.asarray(value, dtype=self.dtype), x.shape).ravel()
+            x, y = x.ravel(), y.ravel()
+            for chunk_x, chunk_y, selected in self._group_points(x, y):
+                chunk = self.chunk(chunk_x, chunk_y)
+                chunk[x[selected] % size, y[selected] % size] = values[selected]
+            return
+
+        (x1, x2, drop_x), (y1, y2, drop_y) = x, y
+        shape = (x2 - x1, y2 - y1)
+        indexed_shape = tuple(
+            length for length, dropped in zip(shape, (drop_x, drop_y)) if not dropped
+        )
+        values = np.broadcast_to(np.asarray(value, dtype=self.dtype), indexed_shape)
+        values = values.reshape(shape)
+        for chunk_x, chunk_y, area, chunk_area in self._overlapping_chunks(x1, x2, y1, y2):
+            self.chunk(chunk_x, chunk_y)[chunk_area] = values[area]
+
+
+    def _parse_index(self, index: Tuple[Any, Any]) -> Tuple[str, Any, Any]:
+        """
+        Sort an index into a ("position", x, y), ("points", xs, ys) or
+        ("slices", (x1, x2, drop_x), (y1, y2, drop_y)), with negative
+        indices wrapped. drop is set for an axis indexed by an integer.
+        """
+        if not isinstance(index, tuple) or len(index) != 2:
+            raise IndexError(f"ChunkedArray needs an (x, y) index, got {index!r}")
+        x, y = index
+        if isinstance(x, (int, np.integer)) and isinstance(y, (int, np.integer)):
+            return "position", self._wrap(int(x), 0), self._wrap(int(y), 1)
+        if not isinstance(x, slice) and not isinstance(y, slice):
+            xs, ys = np.broadcast_arrays(np.asarray(x, dtype=np.intp), np.asarray(y, dtype=np.intp))
+            return "points", self._wrap_array(xs, 0), self._wrap_array(ys, 1)
+
+        bounds = []
+        for axis, i in enumerate(index):
+            if isinstance(i, (int, np.integer)):
+                start = self._wrap(int(i), axis)
+                bounds.append((start, start + 1, True))
+            elif isinstance(i, slice):
+                start, stop, step = i.indices(self.shape[axis])
+                if step != 1:
+                    raise IndexError("ChunkedArray slices can't have a step")
+                bounds.append((start, max(start, stop), False))
+            else:
+                raise IndexError("ChunkedArray can't mix slices and index arrays")
+        return "slices", bounds[0], bounds[1]
+
+
+    def _wrap(self, i: int, axis: int) -> int:
+        """Wrap a negative index, raising IndexError if it is out of bounds"""
+        length = self.shape[axis]
+        if not -length <= i < length:
+            raise IndexError(f"index {i} is out of bounds for axis {axis} with size {length}")
+        return i + length if i < 0 else i
+
+
+    def _wrap_array(self, i: np.ndarray, axis: int) -> np.ndarray:
+        """Wrap negative indices, raising IndexError if any are out of bounds"""
+        length = self.shape[axis]
+        if i.size and (i.min() < -length or i.max() >= length):
+            raise IndexError(f"index out of bounds for axis {axis} with size {length}")
+        return np.where(i < 0, i + length, i)
+
+
+    def _group_points(
+            self, xs: np.ndarray, ys: np.ndarray
+    ) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """
+        Yield each chunk position the flat arrays of points fall in,
+        with the indices of those points
+        """
+        if not xs.size:
+            return
+        chunk_xs, chunk_ys = xs // self.chunk_size, ys // self.chunk_size
+        chunk_ids = chunk_xs * (self.shape[1] // self.chunk_size + 1) + chunk_ys
+        order = np.argsort(chunk_ids, kind="stable")
+        firsts = np.flatnonzero(np.diff(chunk_ids[order], prepend=-1))
+        for selected in np.split(order, firsts[1:]):
+            yield int(chunk_xs[selected[0]]), int(chunk_ys[selected[0]]), selected
+
+
+    def _overlapping_chunks(
+            self, x1: int, x2: int, y1: int, y2: int
+    ) -> Iterator[Tuple[int, int, Tuple[slice, slice], Tuple[slice, slice]]]:
+        """
+        Yield each chunk the area from (x1, y1) up to (x2, y2) overlaps, with
+        the part of the area in the chunk and the same part in chunk indices
+        """
+        size = self.chunk_size
+        if x1 >= x2 or y1 >= y2:
+            return
+        for chunk_x in range(x1 // size, (x2 - 1) // size + 1):
+            left, right = max(x1, chunk_x * size), min(x2, (chunk_x + 1) * size)
+            for chunk_y in range(y1 // size, (y2 - 1) // size + 1):
+                top, bottom = max(y1, chunk_y * size), min(y2, (chunk_y + 1) * size)
+                yield (
+                    chunk_x,
+                    chunk_y,
+                    (slice(left - x1, right - x1), slice(top - y1, bottom - y1)),
+                    (
+                        slice(left - chunk_x * size, right - chunk_x * size),
+                        slice(top - chunk_y * size, bottom - chunk_y * size),
+                    ),
+                )
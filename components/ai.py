@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import random
 from typing import List, Optional, Tuple, TYPE_CHECKING
 
 import numpy as np # type: ignore
@@ -12,11 +11,20 @@ from actions import Action, BumpAction, MeleeAction, MovementAction, WaitAction
 if TYPE_CHECKING:
     from entity import Actor
 
+
+# Idle enemies further than this from the player become dormant
+DORMANT_DISTANCE = 20
+# Idle enemies become dormant after this many turns out of the player's FOV
+DORMANT_TURNS = 10
+
 class BaseAI(Action):
     entity: Actor
 
     def perform(self) -> None:
         raise NotImplementedError
+
+    def alert(self, x: int, y: int) -> None:
+        """Called when the entity is woken by a noise at (x, y)"""
     
     def get_path_to(
         self, dest_x: int, dest_y: int
@@ -25,28 +33,49 @@ class BaseAI(Action):
 
         If there is no valid path, returns empty list.
         """
-        # Copy array of walkable tiles
-        cost = np.array(self.entity.gamemap.tiles["walkable"], dtype=np.int8)
-
-        for entity in self.entity.gamemap.entities:
-            # Check that an entity blocks movement and the cost isn't zer (blocking)
-            if entity.blocks_movement and cost[entity.x, entity.y]:
-                # Add to cost of blocked position
-                # A lower number means more enemies will crowd behind
-                # each other in hallways. A higher number means enemies
-                # will take longer paths in order to surround the player
-                cost[entity.x, entity.y] += 10
-        
+        game_map = self.entity.gamemap
+        window = game_map.path_window((self.entity.x, self.entity.y), (dest_x, dest_y))
+        left, top = window[0].start, window[1].start
+        # Walkable tiles, with extra cost where blocking entities stand
+        cost = game_map.path_cost[window]
+
         # Create a graph from cost array and pass to new pathfinder
         graph = tcod.path.SimpleGraph(cost=cost, cardinal=2, diagonal=3)
         pathfinder = tcod.path.Pathfinder(graph)
 
-        pathfinder.add_root((self.entity.x, self.entity.y))
+        pathfinder.add_root((self.entity.x - left, self.entity.y - top))
 
         # Compute path to destination and remove starting position
-        path: List[List[int]] = pathfinder.path_to((dest_x, dest_y))[1:].tolist()
+        path: List[List[int]] = (
+            pathfinder.path_to((dest_x - left, dest_y - top))[1:] + (left, top)
+        ).tolist()
 
         return [(index[0], index[1]) for index in path]
+    
+    def get_step_towards_player(self) -> Optional[Tuple[int, int]]:
+        """Return the neighbouring tile that is closest to the player
+
+        Reads the engine's shared distance map, so this costs the same
+        no matter how far away the player is. Returns None if no
+        neighbour is closer, if the closest one is occupied, or if the
+        entity is outside the area the distance map covers.
+        """
+        distance = self.engine.player_distance
+        origin_x, origin_y = self.engine.player_distance_origin
+        # Position in the distance map
+        x, y = self.entity.x - origin_x, self.entity.y - origin_y
+        if not (0 <= x < distance.shape[0] and 0 <= y < distance.shape[1]):
+            return None
+        left, top = max(0, x - 1), max(0, y - 1)
+        neighbours = distance[left : x + 2, top : y + 2]
+        index_x, index_y = np.unravel_index(np.argmin(neighbours), neighbours.shape)
+        step_x, step_y = origin_x + left + int(index_x), origin_y + top + int(index_y)
+
+        if neighbours[index_x, index_y] >= distance[x, y]:
+            return None
+        if self.entity.gamemap.blocked[step_x, step_y]:
+            return None
+        return step_x, step_y
 
 
 class ConfusedEnemy(BaseAI):
@@ -64,6 +93,11 @@ class ConfusedEnemy(BaseAI):
         self.previous_ai = previous_ai
         self.turns_remaining = turns_remaining
 
+    def alert(self, x: int, y: int) -> None:
+        """The noise is remembered once the confusion wears off"""
+        if self.previous_ai is not None:
+            self.previous_ai.alert(x, y)
+
     def perform(self) -> None:
         # Revert AI back to original state if the effect has run its course
         if self.turns_remaining <= 0:
@@ -73,7 +107,7 @@ class ConfusedEnemy(BaseAI):
             self.entity.ai = self.previous_ai
         else:
             # Pick a random direction
-            direction_x, direction_y = random.choice(
+            direction_x, direction_y = self.engine.rng.ai.choice(
                 [
                     (-1, -1), #NW
                     (0, -1), #N
@@ -84,7 +118,7 @@ class ConfusedEnemy(BaseAI):
                     (0, 1), #S
                     (1, 1), #SE
                 ]
-            )
+            ).tolist()
 
             self.turns_remaining -= 1
 
@@ -97,6 +131,15 @@ class HostileEnemy(BaseAI):
     def __init__(self, entity: Actor):
         super().__init__(entity)
         self.path: List[Tuple[int, int]] = []
+        self.last_seen_xy: Optional[Tuple[int, int]] = None
+        self.turns_unseen = 0
+    
+
+    def alert(self, x: int, y: int) -> None:
+        """Go to where the noise came from, as if the player was seen there"""
+        self.path = []
+        self.last_seen_xy = x, y
+        self.turns_unseen = 0
     
 
     def perform(self) -> None:
@@ -106,15 +149,35 @@ class HostileEnemy(BaseAI):
         distance = max(abs(dx), abs(dy)) # Chebyshev distance
 
         if self.engine.game_map.visible[self.entity.x, self.entity.y]:
+            self.turns_unseen = 0
             if distance <= 1:
                 return MeleeAction(self.entity, dx, dy).perform()
-        
+
+            self.last_seen_xy = target.x, target.y
+            step = self.get_step_towards_player()
+            if step:
+                self.path = []
+                return MovementAction(
+                    self.entity, step[0] - self.entity.x, step[1] - self.entity.y,
+                ).perform()
+
+            # Another actor is in the way, search a path around the crowd
             self.path = self.get_path_to(target.x, target.y)
+        else:
+            self.turns_unseen += 1
+            if not self.path and self.last_seen_xy:
+                # Head to where the player was last seen
+                self.path = self.get_path_to(*self.last_seen_xy)
+                self.last_seen_xy = None
         
         if self.path:
             dest_x, dest_y = self.path.pop(0)
             return MovementAction(
                 self.entity, dest_x - self.entity.x, dest_y - self.entity.y,
             ).perform()
-        
+
+        if distance > DORMANT_DISTANCE or self.turns_unseen >= DORMANT_TURNS:
+            # Nothing to do, stop taking turns until woken
+            self.engine.game_map.scheduler.sleep(self.entity)
+
         return WaitAction(self.entity).perform()
\ No newline at end of file
@@ -19,6 +19,10 @@ if TYPE_CHECKING:
     from entity import Actor, Item
 
 
+# Dormant actors within this multiple of a fireball's radius are woken
+FIREBALL_NOISE_FACTOR = 3
+
+
 class Consumable(BaseComponent):
     parent: Item
 
@@ -112,7 +116,7 @@ class FireballDamageConsumable(Consumable):
 
         if not self.engine.game_map.visible[target_xy]:
             raise Impossible("You cannot target an area that you cannot see.")
-        
+
         targets_hit = False
         for actor in self.engine.game_map.actors:
             if actor.distance(*target_xy) <= self.radius:
@@ -124,6 +128,10 @@ class FireballDamageConsumable(Consumable):
 
         if not targets_hit:
             raise Impossible("There are no targets in the radius.")
+        # The blast is loud enough to wake anything nearby
+        self.engine.game_map.wake_actors_in_radius(
+            *target_xy, self.radius * FIREBALL_NOISE_FACTOR
+        )
         self.consume()
 
 
@@ -43,7 +43,9 @@ class Fighter(BaseComponent):
         self.parent.char = "%"
         self.parent.color = (180, 10, 0)
         self.parent.blocks_movement = False
+        self.gamemap.update_occupancy(self.parent.x, self.parent.y)
         self.parent.ai = None
+        self.gamemap.scheduler.unschedule(self.parent)
         self.parent.name = f"remains of {self.parent.name}"
         self.parent.render_order = RenderOrder.CORPSE
 
@@ -67,4 +69,8 @@ class Fighter(BaseComponent):
     
 
     def take_damage(self, amount: int) -> None:
+        player = self.engine.player
+        if self.parent is not player:
+            # Whatever hurt it, the actor comes looking for the player
+            self.gamemap.wake_actor(self.parent, player.x, player.y)
         self.hp -= amount
\ No newline at end of file
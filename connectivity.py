@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from typing import List, NamedTuple, Tuple, TYPE_CHECKING
+
+import numpy as np
+import tcod
+
+import tile_types
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+# Cost of digging through a wall tile when joining regions, relative to
+# walking over a floor tile. Higher numbers carve fewer tiles but make
+# longer detours through existing rooms
+CARVE_COST = 5
+# Tiles around a cut off region searched for a corridor before the whole map
+SEARCH_MARGIN = 16
+
+
+class Connectivity(NamedTuple):
+    """How connected a floor was when generated, and what was done about it"""
+    # Separate walkable regions before they were joined
+    regions: int
+    # Walkable tiles which couldn't be reached from the start
+    unreachable_tiles: int
+    # Wall tiles dug out to join the regions
+    carved_tiles: int
+
+
+def label_regions(walkable: np.ndarray) -> Tuple[np.ndarray, int]:
+    """
+    Label the regions of walkable tiles connected by a step in any of the
+    8 directions. Returns an array of labels the shape of `walkable`, with
+    0 for unwalkable tiles and 1 up to the number of regions for the rest,
+    and the number of regions.
+    """
+    width, height = walkable.shape
+    # Work on the tiles in row order, where a step of `width` is one row down
+    tiles = walkable.ravel(order="F")
+    run_starts = tiles.copy()
+    run_starts[1:] &= ~tiles[:-1]
+    run_starts[::width] = tiles[::width]
+    # Number each horizontal run of walkable tiles
+    runs = np.cumsum(run_starts, dtype=np.int32) * tiles
+    run_count = int(runs.max(initial=0))
+
+    # Runs touching in neighbouring rows, straight down or diagonally
+    # Only tiles where either run starts are kept, which leaves one per
+    # pair of runs. Diagonal steps must not wrap around the map's edge
+    not_last = np.tile(np.arange(width) < width - 1, height)
+    not_first = np.tile(np.arange(width) > 0, height)
+    edges_a, edges_b = [], []
+    for a, b, in_row in (
+        (slice(0, -width), slice(width, None), None),
+        (slice(0, -width - 1), slice(width + 1, None), not_last[: -width - 1]),
+        (slice(1, -width + 1 or None), slice(width, None), not_first[1 : -width + 1 or None]),
+    ):
+        touching = tiles[a] & tiles[b] & (run_starts[a] | run_starts[b])
+        if in_row is not None:
+            touching &= in_row
+        touching = np.flatnonzero(touching)
+        edges_a.append(runs[a][touching])
+        edges_b.append(runs[b][touching])
+    run_a = np.concatenate(edges_a)
+    run_b = np.concatenate(edges_b)
+
+    # Union the runs, each run's root is the lowest run it is connected to
+    root = np.arange(run_count + 1, dtype=np.int32)
+    while True:
+        root_a, root_b = root[run_a], root[run_b]
+        unjoined = root_a != root_b
+        if not unjoined.any():
+            break
+        np.minimum.at(
+            root,
+            np.maximum(root_a[unjoined], root_b[unjoined]),
+            np.minimum(root_a[unjoined], root_b[unjoined]),
+        )
+        while True: # Point every run directly at its root
+            next_root = root[root]
+            if (next_root == root).all():
+                break
+            root = next_root
+
+    roots, region_of_run = np.unique(root[1:], return_inverse=True)
+    labels = np.zeros(run_count + 1, dtype=np.int32)
+    labels[1:] = region_of_run + 1
+    return labels[runs].reshape(walkable.shape, order="F"), len(roots)
+
+
+def connect_regions(dungeon: GameMap, start: Tuple[int, int]) -> Connectivity:
+    """
+    Make every walkable tile of the dungeon reachable from `start`.
+    Each region cut off from it is joined by the corridor from the region
+    to the start's region which digs out the fewest walls, possibly passing
+    through other regions. The outer edge of the map is never dug out.
+
+    Regions are searched from one at a time within SEARCH_MARGIN tiles,
+    which is cheap while they are few. Any left over are searched from
+    together over the whole map.
+    """
+    labels, region_count = label_regions(dungeon.walkable)
+    start_region = labels[start]
+    region_sizes = np.bincount(labels.ravel(), minlength=region_count + 1)
+    unreachable_tiles = int(region_sizes[1:].sum() - region_sizes[start_region])
+    if region_count <= 1:
+        return Connectivity(region_count, unreachable_tiles, 0)
+
+    # Bounding box of each region cut off from the start
+    cut_off = np.flatnonzero((labels != 0) & (labels != start_region))
+    cut_off_labels = labels.ravel()[cut_off]
+    order = np.argsort(cut_off_labels, kind="stable")
+    cut_off_labels = cut_off_labels[order]
+    xs, ys = np.unravel_index(cut_off[order], labels.shape)
+    firsts = np.flatnonzero(np.diff(cut_off_labels, prepend=0))
+    regions = cut_off_labels[firsts]
+    boxes = np.stack([
+        np.minimum.reduceat(xs, firsts),
+        np.minimum.reduceat(ys, firsts),
+        np.maximum.reduceat(xs, firsts) + 1,
+        np.maximum.reduceat(ys, firsts) + 1,
+    ], axis=1)
+
+    joined = np.zeros(region_count + 1, dtype=bool)
+    joined[start_region] = True
+    corridors: List[np.ndarray] = []
+    if len(regions) * (2 * SEARCH_MARGIN) ** 2 < labels.size:
+        for region, (x1, y1, x2, y2) in zip(regions.tolist(), boxes.tolist()):
+            window = (
+                slice(max(x1 - SEARCH_MARGIN, 0), x2 + SEARCH_MARGIN),
+                slice(max(y1 - SEARCH_MARGIN, 0), y2 + SEARCH_MARGIN),
+            )
+            found = _find_corridors(dungeon, labels, joined, [region], window)
+            corridors += found
+            joined[region] = bool(found)
+    remaining = regions[~joined[regions]].tolist()
+    if remaining:
+        corridors += _find_corridors(
+            dungeon, labels, joined, remaining, (slice(None), slice(None))
+        )
+    if not corridors:
+        return Connectivity(region_count, unreachable_tiles, 0)
+
+    corridor_x, corridor_y = np.concatenate(corridors).T
+    walls = np.zeros(dungeon.walkable.shape, dtype=bool, order="F")
+    walls[corridor_x, corridor_y] = True
+    walls &= ~dungeon.walkable
+    dungeon.set_tiles((slice(None), slice(None)), tile_types.floor, where=walls)
+
+    return Connectivity(region_count, unreachable_tiles, int(walls.sum()))
+
+
+def _find_corridors(
+    dungeon: GameMap,
+    labels: np.ndarray,
+    joined: np.ndarray,
+    regions: List[int],
+    window: Tuple[slice, slice],
+) -> List[np.ndarray]:
+    """
+    Return the cheapest corridor from each of the `regions` to any region
+    marked in `joined`, as arrays of (x, y) map positions.
+    Only the tiles in `window` are searched, regions which can't be joined
+    within it get no corridor.
+    """
+    window_labels = labels[window]
+    left, top = window[0].indices(labels.shape[0])[0], window[1].indices(labels.shape[1])[0]
+    right, bottom = left + window_labels.shape[0], top + window_labels.shape[1]
+
+    cost = np.where(dungeon.walkable[window], 1, CARVE_COST).astype(np.int8, order="F")
+    # Keep the outer edge of the map solid
+    if left == 0:
+        cost[0, :] = 0
+    if top == 0:
+        cost[:, 0] = 0
+    if right == dungeon.width:
+        cost[-1, :] = 0
+    if bottom == dungeon.height:
+        cost[:, -1] = 0
+    distance = tcod.path.maxarray(cost.shape, dtype=np.int32, order="F")
+    distance[joined[window_labels]] = 0
+    tcod.path.dijkstra2d(distance, cost, 1, 0, out=distance)
+
+    # The tile of each region closest to a joined region
+    in_regions = np.flatnonzero(np.isin(window_labels, regions))
+    region_labels = window_labels.ravel()[in_regions]
+    region_distance = distance.ravel()[in_regions]
+    order = np.lexsort((region_distance, region_labels))
+    firsts = np.flatnonzero(np.diff(region_labels[order], prepend=0))
+    closest = in_regions[order[firsts]]
+
+    # Follow the distances down from each region to a joined region
+    return [
+        tcod.path.hillclimb2d(distance, (x, y), True, False) + (left, top)
+        for x, y in zip(*np.unravel_index(closest, window_labels.shape))
+        if distance[x, y] != np.iinfo(np.int32).max
+    ]
@@ -1,48 +1,128 @@
 from __future__ import annotations
 
-import lzma
-import pickle
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING
 
+import numpy as np
 from tcod.console import Console
 from tcod.map import compute_fov
+import tcod.path
 
 import exceptions
 from message_log import MessageLog
 import render_functions
+from rng import RandomStreams
 
 if TYPE_CHECKING:
     from entity import Actor
     from game_map import GameMap, GameWorld
+    from journal import Journal
+
+
+FOV_RADIUS = 8
+# Number of recent FOV results kept per map
+FOV_CACHE_SIZE = 32
+
 
 class Engine:
     game_map: GameMap
     game_world: GameWorld
 
-    def __init__(self, player: Actor):
+    def __init__(self, player: Actor, seed: Optional[int] = None):
         self.message_log = MessageLog()
         self.mouse_location = (0, 0)
         self.player = player
+        # Number of turns the player has taken
+        self.turn = 0
+        # Turn the game was last autosaved or loaded on
+        self.last_autosave = 0
+        # Records the player's actions if set
+        self.journal: Optional[Journal] = None
+        # Save slot file the game is saved to, if it has one
+        self.save_filename: Optional[str] = None
+        # Every floor is generated from this seed and its floor number
+        self.rng = RandomStreams(seed)
+        self._player_distance: Optional[np.ndarray] = None
+        # Map position of the first tile of `player_distance`
+        self.player_distance_origin = (0, 0)
 
 
     def handle_enemy_turns(self) -> None:
-        for entity in set(self.game_map.actors) - {self.player}:
-            if entity.ai:
-                try:
-                    entity.ai.perform()
-                except exceptions.Impossible: # NOTE useful for debug
-                    pass # Ignore impossible actions from ai
-                            
+        """Let every actor act until it is the player's turn again"""
+        scheduler = self.game_map.scheduler
+        if scheduler.peek() is self.player:
+            scheduler.pop()
+        scheduler.schedule(self.player, scheduler.action_delay(self.player))
+        self.turn += 1
+
+        while self.player.is_alive:
+            actor = scheduler.peek()
+            if actor is None or actor is self.player:
+                break
+            scheduler.pop()
+            try:
+                actor.ai.perform()
+            except exceptions.Impossible: # NOTE useful for debug
+                pass # Ignore impossible actions from ai
+            if actor.is_alive and actor not in scheduler.dormant:
+                scheduler.schedule(actor, scheduler.action_delay(actor))
+        # The player will move before it is needed again
+        self._player_distance = None
+
+
+    @property
+    def player_distance(self) -> np.ndarray:
+        """
+        Return a Dijkstra map of the path distance from every tile to the player.
+        Computed at most once per enemy turn and shared by all chasing enemies.
+        Covers the map's `path_window` around the player, which starts at
+        `player_distance_origin`.
+        """
+        if self._player_distance is None:
+            game_map = self.game_map
+            window = game_map.path_window((self.player.x, self.player.y))
+            left, top = window[0].start, window[1].start
+            cost = game_map.path_cost[window]
+            distance = tcod.path.maxarray(cost.shape, dtype=np.int32, order="F")
+            distance[self.player.x - left, self.player.y - top] = 0
+            tcod.path.dijkstra2d(distance, cost, 2, 3, out=distance)
+            self._player_distance = distance
+            self.player_distance_origin = left, top
+        return self._player_distance
+
 
     def update_fov(self) -> None:
         """Recompute the visible area based on player's pov"""
-        self.game_map.visible[:] = compute_fov(
-            self.game_map.tiles["transparent"],
-            (self.player.x, self.player.y),
-            radius=8,
+        game_map = self.game_map
+        x, y = self.player.x, self.player.y
+        key = (x, y, FOV_RADIUS, game_map.tiles_version)
+        if key == game_map.fov_key:
+            return # Nothing which affects the FOV has changed
+
+        # Only tiles within the FOV radius can be visible
+        window = (
+            slice(max(0, x - FOV_RADIUS), x + FOV_RADIUS + 1),
+            slice(max(0, y - FOV_RADIUS), y + FOV_RADIUS + 1),
         )
+        fov = game_map.fov_cache.get(key)
+        if fov is None:
+            fov = compute_fov(
+                game_map.transparent[window],
+                (x - window[0].start, y - window[1].start),
+                radius=FOV_RADIUS,
+            )
+            game_map.fov_cache[key] = fov
+            if len(game_map.fov_cache) > FOV_CACHE_SIZE:
+                game_map.fov_cache.popitem(last=False)
+        else:
+            game_map.fov_cache.move_to_end(key)
+
+        game_map.visible[game_map.fov_window] = False
+        game_map.visible[window] = fov
+        game_map.fov_window = window
+        game_map.fov_key = key
         # If a tile is visible, is should be explored
-        self.game_map.explored |= self.game_map.visible
+        game_map.explored[window] |= fov
+        game_map.wake_visible_actors()
 
     
     def render(self, console: Console) -> None:
@@ -75,7 +155,7 @@ class Engine:
 
 
     def save_as(self, filename: str) -> None:
-        """Save this Engine instance as a compressed file."""
-        save_data = lzma.compress(pickle.dumps(self))
-        with open(filename, "wb") as f:
-            f.write(save_data)
+        """Save this Engine instance with `savefile.save_engine`"""
+        from savefile import save_engine
+
+        save_engine(self, filename)
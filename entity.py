@@ -5,6 +5,7 @@ import math
 from typing import Optional, Tuple, Type, TypeVar, TYPE_CHECKING, Union
 
 from render_order import RenderOrder
+from scheduler import NORMAL_SPEED
 
 if TYPE_CHECKING:
     from components.ai import BaseAI
@@ -45,7 +46,7 @@ class Entity:
         if parent:
             # If parent is not provided now, it will be set later
             self.parent = parent
-            parent.entities.add(self)
+            parent.add_entity(self)
 
     
     @property
@@ -59,7 +60,7 @@ class Entity:
         clone.x = x
         clone.y = y
         clone.parent = gamemap
-        gamemap.entities.add(clone)
+        gamemap.add_entity(clone)
         
         return clone
     
@@ -67,14 +68,19 @@ class Entity:
         self, x: int, y: int, gamemap: Optional[GameMap] = None
     ) -> None:
         """Place entity at new location. Handles moving accross maps"""
-        self.x = x
-        self.y = y
         if gamemap:
             if hasattr(self, "parent"): # may be uninitialized
                 if self.parent is self.gamemap:
-                    self.gamemap.entities.remove(self)
+                    self.gamemap.remove_entity(self)
+            self.x = x
+            self.y = y
             self.parent = gamemap
-            gamemap.entities.add(self)
+            gamemap.add_entity(self)
+        elif hasattr(self, "parent") and self.parent is self.gamemap:
+            self.gamemap.move_entity(self, x, y)
+        else:
+            self.x = x
+            self.y = y
     
 
     def distance(self, x: int, y: int) -> float:
@@ -88,8 +94,7 @@ class Entity:
     
     def move(self, dx: int, dy: int) -> None:
         # Move the entity by a given amount
-        self.x += dx
-        self.y += dy
+        self.gamemap.move_entity(self, self.x + dx, self.y + dy)
 
 
 class Actor(Entity):
@@ -104,6 +109,7 @@ class Actor(Entity):
         ai_cls: Type[BaseAI],
         fighter: Fighter,
         inventory: Inventory,
+        speed: int = NORMAL_SPEED,
     ):
         super().__init__(
             x=x,
@@ -117,6 +123,9 @@ class Actor(Entity):
 
         self.ai: Optional[BaseAI] = ai_cls(self)
 
+        # How often this actor acts, relative to NORMAL_SPEED
+        self.speed = speed
+
         self.fighter = fighter
         self.fighter.parent = self
 
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from rng import RandomStreams
+
+
+def generate_floor_data(rng: RandomStreams, settings: Dict[str, Any]) -> bytes:
+    """
+    Generate a floor with `procgen.generate` and return it as
+    `savefile.dump_floor` data, without the player.
+    Runs in a worker process, so uses a stand-in engine and player.
+    """
+    import copy
+
+    from engine import Engine
+    import entity_factories
+    from savefile import dump_floor
+    from procgen import generate
+
+    engine = Engine(player=copy.deepcopy(entity_factories.player))
+    game_map = generate(engine=engine, rng=rng, **settings)
+    game_map.remove_entity(engine.player)
+    return dump_floor(game_map, engine)
+
+
+class FloorPrefetcher:
+    """
+    Generates a floor in a background process before it is needed.
+    Only one floor is prefetched at a time. The prefetch is not saved.
+    """
+
+    def __init__(self) -> None:
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._key: Optional[Tuple[Any, ...]] = None
+        self._future: Optional[Future[bytes]] = None
+
+
+    @staticmethod
+    def _key_of(rng: RandomStreams, settings: Dict[str, Any]) -> Tuple[Any, ...]:
+        return (rng.seed, rng.key, tuple(sorted(settings.items())))
+
+
+    def start(self, rng: RandomStreams, settings: Dict[str, Any]) -> None:
+        """Start generating the floor for fresh streams `rng` and `settings`"""
+        key = self._key_of(rng, settings)
+        if key == self._key:
+            return
+        if self._future is not None:
+            self._future.cancel()
+        if self._executor is None:
+            # Spawn a fresh interpreter rather than forking the game's window
+            self._executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            )
+        try:
+            self._future = self._executor.submit(generate_floor_data, rng, settings)
+        except BrokenProcessPool:
+            # The worker died, the floor will be generated when it is needed
+            self._executor = None
+            self._future = None
+            return
+        self._key = key
+
+
+    def take(self, rng: RandomStreams, settings: Dict[str, Any]) -> Optional[bytes]:
+        """
+        Return the floor data for `rng` and `settings` if it has finished
+        generating, otherwise None.
+        """
+        key = self._key_of(rng, settings)
+        future, prefetched_key = self._future, self._key
+        self._future = self._key = None
+        if future is None:
+            return None
+        if prefetched_key != key or not future.done():
+            future.cancel()
+            return None
+        if future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+
+    def close(self) -> None:
+        """Drop any prefetch and stop the worker without waiting for it"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._future = self._key = None
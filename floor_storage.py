@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import lzma
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Iterator, Optional, Tuple, Union, TYPE_CHECKING
+
+from savefile import SavedFloor, dump_floor, load_floor
+
+if TYPE_CHECKING:
+    from engine import Engine
+    from game_map import GameMap
+
+
+class FloorStorage:
+    """
+    Holds the floors of a GameWorld which the player is not on.
+
+    The `max_live_floors` most recently left floors are kept as they are.
+    Older floors are encoded by `savefile.dump_floor` and compressed in
+    memory, and once those take more than `memory_budget` bytes the oldest
+    are moved to files in `spill_directory`. Floors are restored when they
+    are taken back out. A spill directory made by the storage is removed
+    by `close`, or when the storage is dropped or the game exits.
+
+    Live floors of a loaded save are kept as `savefile.SavedFloor` until
+    they are taken, so they are only read from the save if they are needed.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        max_live_floors: int,
+        memory_budget: int,
+        spill_directory: Optional[str] = None,
+    ):
+        self.engine = engine
+        self.max_live_floors = max_live_floors
+        self.memory_budget = memory_budget
+        self.spill_directory = spill_directory
+
+        # Each ordered from least to most recently stored
+        self._live: OrderedDict[int, Union[GameMap, SavedFloor]] = OrderedDict()
+        self._compressed: OrderedDict[int, bytes] = OrderedDict()
+        self._spilled: OrderedDict[int, str] = OrderedDict()
+        # Removes the spill directory if this storage made it
+        self._finalizer: Optional[weakref.finalize] = None
+
+
+    def __contains__(self, floor: int) -> bool:
+        return floor in self._live or floor in self._compressed or floor in self._spilled
+
+
+    @property
+    def compressed_size(self) -> int:
+        """Bytes used by floors compressed in memory"""
+        return sum(len(data) for data in self._compressed.values())
+
+
+    def store(self, floor: int, game_map: GameMap) -> None:
+        """Store a floor the player has left"""
+        self._live[floor] = game_map
+        while len(self._live) > self.max_live_floors:
+            old_floor, old_map = self._live.popitem(last=False)
+            self._compressed[old_floor] = self._compress(old_map)
+
+        size = self.compressed_size
+        while size > self.memory_budget and self._compressed:
+            old_floor, data = self._compressed.popitem(last=False)
+            size -= len(data)
+            self._spilled[old_floor] = self._spill(old_floor, data)
+
+
+    def take(self, floor: int) -> GameMap:
+        """Remove a stored floor and return it"""
+        if floor in self._live:
+            return self._load(self._live.pop(floor))
+        if floor in self._compressed:
+            return self._decompress(self._compressed.pop(floor))
+
+        path = self._spilled.pop(floor)
+        with open(path, "rb") as f:
+            data = f.read()
+        os.remove(path)
+        return self._decompress(data)
+
+
+    def stored_floors(self) -> Iterator[Tuple[int, Union[GameMap, SavedFloor, bytes]]]:
+        """
+        Yield each stored floor from least to most recently stored, as its
+        GameMap or SavedFloor if it is live or its compressed data otherwise
+        """
+        for floor, path in self._spilled.items():
+            with open(path, "rb") as f:
+                yield floor, f.read()
+        yield from self._compressed.items()
+        yield from self._live.items()
+
+
+    def restore(self, floor: int, stored: Union[GameMap, SavedFloor, bytes]) -> None:
+        """Put back a floor from `stored_floors`, as the most recently stored"""
+        if isinstance(stored, bytes):
+            self._compressed[floor] = stored
+        else:
+            self._live[floor] = stored
+
+
+    def close(self) -> None:
+        """Delete the spilled floors, and the spill directory if this storage made it"""
+        for path in self._spilled.values():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._spilled.clear()
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self.spill_directory = None
+
+
+    def _load(self, game_map: Union[GameMap, SavedFloor]) -> GameMap:
+        if isinstance(game_map, SavedFloor):
+            return game_map.load(self.engine)
+        return game_map
+
+
+    def _compress(self, game_map: Union[GameMap, SavedFloor]) -> bytes:
+        if isinstance(game_map, SavedFloor):
+            return lzma.compress(game_map.dump())
+        return lzma.compress(dump_floor(game_map, self.engine))
+
+
+    def _decompress(self, data: bytes) -> GameMap:
+        return load_floor(lzma.decompress(data), self.engine)
+
+
+    def _spill(self, floor: int, data: bytes) -> str:
+        """Write a compressed floor to disk, returning the file path"""
+        if self.spill_directory is None:
+            self.spill_directory = tempfile.mkdtemp(prefix="floors_")
+            self._finalizer = weakref.finalize(
+                self, shutil.rmtree, self.spill_directory, ignore_errors=True
+            )
+        path = os.path.join(self.spill_directory, f"floor_{floor}.xz")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
@@ -1,37 +1,147 @@
 from __future__ import annotations
 
-from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+from collections import OrderedDict, deque
+from typing import AbstractSet, Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union, TYPE_CHECKING
 
 import numpy as np
 from tcod.console import Console
 
+from chunked_array import ChunkedArray
 from entity import Actor, Item
+from floor_prefetch import FloorPrefetcher
+from floor_storage import FloorStorage
+from savefile import load_floor
+from scheduler import TurnScheduler
 import tile_types
 
 if TYPE_CHECKING:
+    from connectivity import Connectivity
     from engine import Engine
     from entity import Entity
+    from rng import RandomStreams
+
+
+_NO_ENTITIES: AbstractSet[Entity] = frozenset()
+
+# Extra path cost of a tile occupied by a blocking entity
+# A lower number means more enemies will crowd behind
+# each other in hallways. A higher number means enemies
+# will take longer paths in order to surround the player
+BLOCKED_PATH_COST = 10
+# Tiles around the start and goal which pathfinding searches on chunked
+# maps. Dense maps are always searched whole
+PATH_MARGIN = 32
+
+# Area of the map drawn on screen, larger maps scroll to keep the player in view
+VIEW_WIDTH = 80
+VIEW_HEIGHT = 43
+
+# Maps with at least this many tiles generate the next floor in the
+# background by default. Smaller ones generate faster than a worker starts
+PREFETCH_MIN_TILES = 256 * 256
 
 
 class GameMap:
+    """
+    A floor of the dungeon.
+
+    If `chunk_size` is given, the tile arrays are ChunkedArrays whose chunks
+    are only made when first used, so the map can be far larger than what
+    dense arrays would fit in memory. `generate_tiles` is then called with
+    a chunk position to make the tile IDs of each chunk, otherwise chunks
+    start as walls.
+    """
+
     def __init__(
-            self, engine: Engine, width: int, height: int, entities: Iterable[Entity] = ()
+            self,
+            engine: Engine,
+            width: int,
+            height: int,
+            entities: Iterable[Entity] = (),
+            chunk_size: Optional[int] = None,
+            generate_tiles: Optional[Callable[[int, int], np.ndarray]] = None,
     ):
         self.engine = engine
         self.width, self.height = width, height
-        self.entities = set(entities)
-        self.tiles = np.full((width, height), fill_value=tile_types.wall, order="F")
+        self.chunk_size = chunk_size
+        # Tile IDs, see the lookup tables in tile_types
+        self.tiles = self._new_array(np.uint8, tile_types.wall, generate_tiles)
+        # Properties of each tile, kept in sync with `tiles` by set_tiles
+        if chunk_size is None:
+            self.walkable = tile_types.walkable_table[self.tiles]
+            self.transparent = tile_types.transparent_table[self.tiles]
+        else:
+            self.walkable = self._new_array(bool, False, self._walkable_chunk)
+            self.transparent = self._new_array(bool, False, self._transparent_chunk)
+        # Incremented by every tile write, so results derived from the
+        # transparency or walkability of tiles can tell when they are stale
+        self.tiles_version = 0
+
+        # Tiles occupied by an entity that blocks movement
+        self.blocked = self._new_array(bool, False)
+        # Pathfinding costs, built on first use and kept in sync with `blocked`
+        self._path_cost: Optional[Union[np.ndarray, ChunkedArray]] = None
+
+        # Living actors on this map, ordered by their next turn
+        self.scheduler = TurnScheduler()
+
+        # Dicts with None values are used as sets which keep the order
+        # entities were added in, so games replay the same after loading
+        self.entities: Dict[Entity, None] = {}
+        # Entities keyed by their (x, y) position, for O(1) location lookups
+        self.entity_locations: Dict[Tuple[int, int], Dict[Entity, None]] = {}
+        for entity in entities:
+            self.add_entity(entity)
 
         # Tiles the player can currently see
-        self.visible = np.full(
-            (width, height), fill_value=False, order="F"
-        )
+        self.visible = self._new_array(bool, False)
         # Tiles the player has seen before
-        self.explored = np.full(
-            (width, height), fill_value=False, order="F"
-        )
+        self.explored = self._new_array(bool, False)
+        # Area of the map the last FOV was computed over
+        self.fov_window: Tuple[slice, slice] = (slice(0, 0), slice(0, 0))
+        # (x, y, radius, tiles_version) of the FOV currently in `visible`
+        self.fov_key: Optional[Tuple[int, int, int, int]] = None
+        # Recently computed FOV windows, least recently used first
+        self.fov_cache: OrderedDict[Tuple[int, int, int, int], np.ndarray] = OrderedDict()
 
         self.downstairs_location = (0, 0)
+        # Where the player arrives from the floor above
+        self.upstairs_location = (0, 0)
+        # Number of rooms the generator placed
+        self.room_count = 0
+        # Set by the generator's connectivity pass
+        self.connectivity: Optional[Connectivity] = None
+
+
+    def _new_array(
+            self,
+            dtype: Any,
+            fill_value: Any,
+            generate: Optional[Callable[[int, int], np.ndarray]] = None,
+    ) -> Any:
+        """Return a new array of the map's size, chunked if the map is"""
+        if self.chunk_size is None:
+            return np.full(
+                (self.width, self.height), fill_value=fill_value, dtype=dtype, order="F"
+            )
+        return ChunkedArray(
+            (self.width, self.height), dtype, fill_value, self.chunk_size, generate
+        )
+
+
+    def _walkable_chunk(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        return tile_types.walkable_table[self.tiles.chunk(chunk_x, chunk_y)]
+
+
+    def _transparent_chunk(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        return tile_types.transparent_table[self.tiles.chunk(chunk_x, chunk_y)]
+
+
+    def _path_cost_chunk(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        walkable = self.walkable.chunk(chunk_x, chunk_y)
+        cost = walkable.astype(np.int8, order="F")
+        cost[self.blocked.chunk(chunk_x, chunk_y) & walkable] += BLOCKED_PATH_COST
+        return cost
 
 
     @property
@@ -56,32 +166,231 @@ class GameMap:
         )
 
 
+    def set_tiles(
+            self, index: Tuple, tile: int, where: Optional[np.ndarray] = None
+    ) -> None:
+        """
+        Write the `tile` ID to the tiles at `index`. All tile writes must use this
+        If a boolean `where` mask is given then `index` must be slices, and
+        only the tiles of that area where the mask is True are written
+        """
+        if where is None:
+            self.tiles[index] = tile
+            self.walkable[index] = tile_types.walkable_table[tile]
+            self.transparent[index] = tile_types.transparent_table[tile]
+        else:
+            for array, value in (
+                (self.tiles, tile),
+                (self.walkable, tile_types.walkable_table[tile]),
+                (self.transparent, tile_types.transparent_table[tile]),
+            ):
+                # A view of dense arrays, but a copy of chunked ones
+                area = array[index]
+                area[where] = value
+                if self.chunk_size is not None:
+                    array[index] = area
+        self.tiles_version += 1
+        self._path_cost = None
+
+
+    def add_entity(self, entity: Entity) -> None:
+        """Add an entity to this map at its current position"""
+        self.entities[entity] = None
+        self._index_entity(entity)
+        if (
+            isinstance(entity, Actor)
+            and entity.is_alive
+            and entity not in self.scheduler
+        ):
+            self.scheduler.schedule(entity)
+
+
+    def remove_entity(self, entity: Entity) -> None:
+        """Remove an entity from this map and the location index"""
+        del self.entities[entity]
+        self._unindex_entity(entity)
+        if isinstance(entity, Actor):
+            self.scheduler.unschedule(entity)
+
+
+    def move_entity(self, entity: Entity, x: int, y: int) -> None:
+        """Move an entity on this map, keeping the location index current"""
+        self._unindex_entity(entity)
+        entity.x, entity.y = x, y
+        self._index_entity(entity)
+
+
+    def _index_entity(self, entity: Entity) -> None:
+        self.entity_locations.setdefault((entity.x, entity.y), {})[entity] = None
+        if entity.blocks_movement:
+            self.update_occupancy(entity.x, entity.y)
+
+
+    def _unindex_entity(self, entity: Entity) -> None:
+        location = (entity.x, entity.y)
+        entities_here = self.entity_locations[location]
+        del entities_here[entity]
+        if not entities_here:
+            del self.entity_locations[location]
+        if entity.blocks_movement:
+            self.update_occupancy(*location)
+
+
+    def update_occupancy(self, x: int, y: int) -> None:
+        """
+        Recompute whether a tile is blocked by an entity. Must be called
+        when an entity at this location changes its `blocks_movement`
+        """
+        blocked = self.get_blocking_entity_at_location(x, y) is not None
+        self.blocked[x, y] = blocked
+        if self._path_cost is not None and self.walkable[x, y]:
+            self._path_cost[x, y] = 1 + BLOCKED_PATH_COST * blocked
+
+
+    @property
+    def path_cost(self) -> Union[np.ndarray, ChunkedArray]:
+        """
+        Movement cost of each tile for pathfinding, 0 where not walkable.
+        Tiles occupied by blocking entities cost extra.
+        This array is shared, copy it before making changes.
+        """
+        if self._path_cost is None:
+            if self.chunk_size is not None:
+                self._path_cost = self._new_array(np.int8, 0, self._path_cost_chunk)
+            else:
+                self._path_cost = self.walkable.astype(np.int8, order="F")
+                self._path_cost[self.blocked & self.walkable] += BLOCKED_PATH_COST
+        return self._path_cost
+
+
+    def path_window(self, *points: Tuple[int, int]) -> Tuple[slice, slice]:
+        """
+        Return the area pathfinding between `points` searches. That is the
+        whole map for dense maps, and within PATH_MARGIN tiles of the points
+        for chunked maps. The slices' starts are the area's map position.
+        """
+        if self.chunk_size is None:
+            return slice(0, self.width), slice(0, self.height)
+        xs, ys = zip(*points)
+        return (
+            slice(max(min(xs) - PATH_MARGIN, 0), min(max(xs) + PATH_MARGIN + 1, self.width)),
+            slice(max(min(ys) - PATH_MARGIN, 0), min(max(ys) + PATH_MARGIN + 1, self.height)),
+        )
+
+
+    def get_entities_at_location(self, x: int, y: int) -> AbstractSet[Entity]:
+        """Return the entities at the given location. Do not modify the result"""
+        entities = self.entity_locations.get((x, y))
+        return _NO_ENTITIES if entities is None else entities.keys()
+
+
     def get_blocking_entity_at_location(
             self, location_x: int, location_y: int
     ) -> Optional[Entity]:
-        for entity in self.entities:
-            if (
-                entity.blocks_movement
-                and entity.x == location_x
-                and entity.y == location_y
-            ):
+        for entity in self.get_entities_at_location(location_x, location_y):
+            if entity.blocks_movement:
                 return entity
             
         return None
 
 
     def get_actor_at_location(self, x: int, y: int) -> Optional[Actor]:
-        for actor in self.actors:
-            if actor.x == x and actor.y == y:
-                return actor
+        for entity in self.get_entities_at_location(x, y):
+            if isinstance(entity, Actor) and entity.is_alive:
+                return entity
             
         return None
 
+
+    def nearest_free_location(self, x: int, y: int) -> Tuple[int, int]:
+        """
+        Return the tile fewest steps from (x, y) over walkable tiles which
+        no blocking entity is on. That is (x, y) itself if it is free, and
+        also if no free tile can be reached.
+        """
+        queue = deque([(x, y)])
+        seen = {(x, y)}
+        while queue:
+            tile_x, tile_y = queue.popleft()
+            if not self.blocked[tile_x, tile_y]:
+                return tile_x, tile_y
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    next_xy = next_x, next_y = tile_x + dx, tile_y + dy
+                    if (
+                        next_xy not in seen
+                        and self.in_bounds(next_x, next_y)
+                        and self.walkable[next_x, next_y]
+                    ):
+                        seen.add(next_xy)
+                        queue.append(next_xy)
+        return x, y
+
+
+    def wake_actor(self, actor: Actor, noise_x: int, noise_y: int) -> None:
+        """
+        Wake an actor if it is dormant and alert it to a noise at the given
+        location, so it goes to look instead of falling straight back asleep
+        """
+        self.scheduler.wake(actor)
+        if actor.ai is not None:
+            actor.ai.alert(noise_x, noise_y)
+
+
+    def wake_visible_actors(self) -> None:
+        """
+        Wake dormant actors which are in the player's FOV. Only the visible
+        tiles are checked, through the location index, so this doesn't
+        depend on how many actors are dormant
+        """
+        dormant = self.scheduler.dormant
+        if not dormant:
+            return
+        window = self.fov_window
+        xs, ys = np.nonzero(np.asarray(self.visible[window]))
+        player = self.engine.player
+        for x, y in zip((xs + window[0].start).tolist(), (ys + window[1].start).tolist()):
+            for entity in list(self.get_entities_at_location(x, y)):
+                if isinstance(entity, Actor) and entity in dormant:
+                    self.wake_actor(entity, player.x, player.y)
+
+
+    def wake_actors_in_radius(self, x: int, y: int, radius: float) -> None:
+        """Wake dormant actors within `radius` of the given location, alerting them to it"""
+        for actor in [
+            actor for actor in self.scheduler.dormant if actor.distance(x, y) <= radius
+        ]:
+            self.wake_actor(actor, x, y)
+
+
     def in_bounds(self, x: int, y: int) -> bool:
         """Return True if x & y are within bounds of map"""
         return 0 <= x < self.width and 0 <= y < self.height
     
 
+    @property
+    def view(self) -> Tuple[slice, slice]:
+        """
+        The area of the map drawn on screen, which follows the player on
+        maps larger than VIEW_WIDTH by VIEW_HEIGHT. The slices' starts are
+        the map position drawn at the top left of the screen.
+        """
+        player = self.engine.player
+        width, height = min(self.width, VIEW_WIDTH), min(self.height, VIEW_HEIGHT)
+        left = min(max(player.x - width // 2, 0), self.width - width)
+        top = min(max(player.y - height // 2, 0), self.height - height)
+        return slice(left, left + width), slice(top, top + height)
+
+
+    def map_position(self, screen_x: int, screen_y: int) -> Optional[Tuple[int, int]]:
+        """Return the map position drawn at a screen position, or None if no tile is drawn there"""
+        view_x, view_y = self.view
+        x, y = view_x.start + screen_x, view_y.start + screen_y
+        if view_x.start <= x < view_x.stop and view_y.start <= y < view_y.stop:
+            return x, y
+        return None
+
+
     def render(self, console: Console) -> None:
         """
         Renders the map
@@ -90,27 +399,24 @@ class GameMap:
         If not visible but in "explored" array, then draw it with "dark" colors.
         Otherwise, default is "SHROUD"
         """
-        console.rgb[0 : self.width, 0 : self.height] = np.select(
-            condlist=[self.visible, self.explored],
-            choicelist=[self.tiles["light"], self.tiles["dark"]],
+        view = self.view
+        tiles = self.tiles[view]
+        console.rgb[0 : tiles.shape[0], 0 : tiles.shape[1]] = np.select(
+            condlist=[self.visible[view], self.explored[view]],
+            choicelist=[
+                tile_types.light_table[tiles], tile_types.dark_table[tiles]
+            ],
             default=tile_types.SHROUD
         )
 
-        entities_sorted_for_render = sorted(
-            self.entities, key=lambda x: x.render_order.value
-        )
-
-        for entity in entities_sorted_for_render:
-            # only print entities in FOV
-            if self.visible[entity.x, entity.y]:
-                console.print(
-                    entity.x, entity.y, entity.char, fg=entity.color
-                )
+        self.render_entities(console)
     
     def render_entities(self, console: Console) -> None:
         """
         Renders only entities
         """
+        view = self.view
+        left, top = view[0].start, view[1].start
         entities_sorted_for_render = sorted(
             self.entities, key=lambda x: x.render_order.value
         )
@@ -119,7 +425,7 @@ class GameMap:
             # only print entities in FOV
             if self.visible[entity.x, entity.y]:
                 console.print(
-                    entity.x, entity.y, entity.char, fg=entity.color
+                    entity.x - left, entity.y - top, entity.char, fg=entity.color
                 )
 
 
@@ -140,7 +446,11 @@ class GameWorld:
         room_max_size: int,
         max_monsters_per_room: int,
         max_items_per_room: int,
-        current_floor: int
+        current_floor: int,
+        generator: str = "rooms",
+        max_live_floors: int = 3,
+        floor_memory_budget: int = 16 * 1024 * 1024,
+        prefetch_floors: Optional[bool] = None,
     ):
         self.engine = engine
 
@@ -157,16 +467,29 @@ class GameWorld:
 
         self.current_floor = current_floor
 
-        # TODO: implement floor storage and reverse traversal
-        # self.floors[GameMap] = []
-    
+        # Name of the procgen.GENERATORS generator used for new floors
+        self.generator = generator
 
-    def generate_floor(self) -> None:
-        from procgen import generate_dungeon
+        # Floors the player has left, to return to by stairs
+        self.floors = FloorStorage(
+            engine,
+            max_live_floors=max_live_floors,
+            memory_budget=floor_memory_budget,
+        )
+
+        # Generates the next floor down in the background
+        if prefetch_floors is None:
+            prefetch_floors = map_width * map_height >= PREFETCH_MIN_TILES
+        self.prefetcher: Optional[FloorPrefetcher] = (
+            FloorPrefetcher() if prefetch_floors else None
+        )
 
-        self.current_floor += 1
 
-        self.engine.game_map = generate_dungeon(
+    @property
+    def dungeon_settings(self) -> Dict[str, Any]:
+        """Settings passed to `procgen.generate` for each floor"""
+        return dict(
+            generator=self.generator,
             max_rooms=self.max_rooms,
             room_min_size=self.room_min_size,
             room_max_size=self.room_max_size,
@@ -174,5 +497,86 @@ class GameWorld:
             map_height=self.map_height,
             max_monsters_per_room=self.max_monsters_per_room,
             max_items_per_room=self.max_items_per_room,
-            engine=self.engine,
         )
+
+
+    def floor_rng(self, floor: int) -> RandomStreams:
+        """Return the random streams the given floor is generated from"""
+        return self.engine.rng.floor(floor)
+
+
+    def generate_floor(self) -> None:
+        """Generate a new floor below the current one and move the player to it"""
+        from procgen import generate
+
+        self._store_current_floor()
+        self.current_floor += 1
+        rng = self.floor_rng(self.current_floor)
+        player = self.engine.player
+
+        data = None
+        if self.prefetcher:
+            data = self.prefetcher.take(rng, self.dungeon_settings)
+        # The player arrives after the floor's monsters, however it was
+        # generated, so the schedule is the same either way
+        if data is not None:
+            game_map = load_floor(data, self.engine)
+            player.place(*game_map.upstairs_location, game_map)
+        else:
+            game_map = generate(engine=self.engine, rng=rng, **self.dungeon_settings)
+            game_map.scheduler.schedule(player)
+        if self.current_floor > 1:
+            game_map.set_tiles(game_map.upstairs_location, tile_types.up_stairs)
+        self.engine.game_map = game_map
+        self._prefetch_next_floor()
+
+
+    def descend(self) -> None:
+        """Move the player to the floor below, generating it if needed"""
+        if self.current_floor + 1 not in self.floors:
+            return self.generate_floor()
+
+        self._store_current_floor()
+        self.current_floor += 1
+        game_map = self.floors.take(self.current_floor)
+        self._arrive(game_map, *game_map.upstairs_location)
+        self.engine.game_map = game_map
+        self._prefetch_next_floor()
+
+
+    def ascend(self) -> None:
+        """Move the player back to the floor above"""
+        self._store_current_floor()
+        self.current_floor -= 1
+        game_map = self.floors.take(self.current_floor)
+        self._arrive(game_map, *game_map.downstairs_location)
+        self.engine.game_map = game_map
+
+
+    def close(self) -> None:
+        """Release the files of the stored floors and stop prefetching, when the game is over"""
+        self.floors.close()
+        if self.prefetcher:
+            self.prefetcher.close()
+
+
+    def _arrive(self, game_map: GameMap, x: int, y: int) -> None:
+        """
+        Place the player at the stairs at (x, y) of a floor returned to.
+        A monster which has moved onto the stairs is moved aside first.
+        """
+        blocker = game_map.get_blocking_entity_at_location(x, y)
+        if blocker is not None:
+            blocker.place(*game_map.nearest_free_location(x, y))
+        self.engine.player.place(x, y, game_map)
+
+
+    def _prefetch_next_floor(self) -> None:
+        next_floor = self.current_floor + 1
+        if self.prefetcher and next_floor not in self.floors:
+            self.prefetcher.start(self.floor_rng(next_floor), self.dungeon_settings)
+
+
+    def _store_current_floor(self) -> None:
+        if hasattr(self.engine, "game_map"): # Unset before the first floor
+            self.floors.store(self.current_floor, self.engine.game_map)
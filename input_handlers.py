@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import os
-
 from typing import Callable, Optional, Tuple, TYPE_CHECKING, Union
 import tcod
 from tcod import libtcodpy
@@ -146,6 +144,10 @@ class EventHandler(BaseEventHandler):
         """
         if action is None:
             return False
+
+        journal = self.engine.journal
+        if journal is not None:
+            entry = journal.entry(action, self.engine)
         
         try:
             action.perform()
@@ -156,12 +158,15 @@ class EventHandler(BaseEventHandler):
         self.engine.handle_enemy_turns()
 
         self.engine.update_fov()
+        if journal is not None:
+            journal.append(entry)
         return True
 
     
     def ev_mousemotion(self, event: tcod.event.MouseMotion) -> None:
-        if self.engine.game_map.in_bounds(event.tile.x, event.tile.y):
-            self.engine.mouse_location = event.tile.x, event.tile.y
+        position = self.engine.game_map.map_position(event.tile.x, event.tile.y)
+        if position is not None:
+            self.engine.mouse_location = position
     
 
     def on_render(self, console: tcod.console.Console) -> None:
@@ -303,7 +308,9 @@ class SelectIndexHandler(AskUserEventHandler):
     def on_render(self, console: tcod.console.Console) -> None:
         """Highlight the tile under the cursor."""
         super().on_render(console)
+        view_x, view_y = self.engine.game_map.view
         x, y = self.engine.mouse_location
+        x, y = x - view_x.start, y - view_y.start
         console.rgb["bg"][x, y] = color.white
         console.rgb["fg"][x, y] = color.black
 
@@ -324,9 +331,10 @@ class SelectIndexHandler(AskUserEventHandler):
             dx, dy = MOVE_KEYS[key]
             x += dx * modifier
             y += dy * modifier
-            # Clamp cursor index to map size
-            x = max(0, min(x, self.engine.game_map.width -1))
-            y = max(0, min(y, self.engine.game_map.height -1))
+            # Clamp cursor index to the area of the map on screen
+            view_x, view_y = self.engine.game_map.view
+            x = max(view_x.start, min(x, view_x.stop - 1))
+            y = max(view_y.start, min(y, view_y.stop - 1))
             self.engine.mouse_location = x, y
             return None
         
@@ -337,9 +345,10 @@ class SelectIndexHandler(AskUserEventHandler):
     def ev_mousebuttondown(self, event: tcod.event.MouseButtonDown) -> Optional[ActionOrHandler]:
         """Left click confirms a selection"""
 
-        if self.engine.game_map.in_bounds(*event.tile):
+        position = self.engine.game_map.map_position(*event.tile)
+        if position is not None:
             if event.button == 1:
-                return self.on_index_selected(*event.tile)
+                return self.on_index_selected(*position)
             
         return super().ev_mousebuttondown(event)
     
@@ -390,11 +399,12 @@ class AreaRangedAttackHandler(SelectIndexHandler):
         """Highlight the tile under the cursor"""
         super().on_render(console)
 
+        view_x, view_y = self.engine.game_map.view
         x, y = self.engine.mouse_location
 
         # Draw a rectangle around the targeted area to show affected tiles
         render_functions.render_circle_frame(
-            console, x, y, self.radius,
+            console, x - view_x.start, y - view_y.start, self.radius,
         )
         self.engine.game_map.render_entities(console)
 
@@ -415,9 +425,10 @@ class MainGameEventHandler(EventHandler):
 
         player = self.engine.player
 
-        if key == tcod.event.KeySym.PERIOD and modifier & (
+        if key in (tcod.event.KeySym.PERIOD, tcod.event.KeySym.COMMA) and modifier & (
             tcod.event.KeySym.LSHIFT | tcod.event.KeySym.RSHIFT
         ):
+            # '>' and '<' both take the stairs under the player
             return actions.TakeStairsAction(player)
 
         if key in MOVE_KEYS:
@@ -451,8 +462,13 @@ class MainGameEventHandler(EventHandler):
 class GameOverEventHandler(EventHandler):
     def on_quit(self) -> None:
         """Handle exiting out of a lost game."""
-        if os.path.exists("savegame.sav"):
-            os.remove("savegame.sav") # Deletes active save file
+        from savefile import remove_save
+
+        if self.engine.journal is not None:
+            self.engine.journal.close()
+        filename = self.engine.save_filename
+        if filename is not None:
+            remove_save(filename) # Deletes active save file and its journal
         raise exceptions.QuitWithoutSaving() # Prevent saving a lost game
     
     def ev_quit(self, event: tcod.event.Quit) -> None:
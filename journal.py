@@ -0,0 +1,181 @@
+"""
+An append-only journal of the player's actions, for recovering the turns
+played since the last save.
+
+The journal is a header, then one fixed size record for each turn the
+player took. A record holds the turn number, the action's type and
+arguments, and a check of the random number generators' state before
+the action. Enemy turns aren't recorded, they follow from the player's
+actions and the saved state.
+
+Recovery loads the last save and replays the records from its turn on,
+stopping at the first which doesn't match the game it is replayed on.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import tempfile
+from typing import BinaryIO, Iterator, Optional, Tuple, TYPE_CHECKING
+
+import actions
+import input_handlers
+from rng import RandomStreams
+
+if TYPE_CHECKING:
+    from engine import Engine
+
+
+MAGIC = b"RLJRNL\x00\x00"
+JOURNAL_VERSION = 1
+# Magic, journal version and the game's seed
+HEADER = struct.Struct("<8sIQ")
+# Turn, action type, dx, dy, inventory index of the item or -1,
+# target x, target y, and the RNG check
+RECORD = struct.Struct("<IBbbbiiQ")
+
+# Index of each journaled action class is its type in a record
+ACTION_TYPES = (
+    actions.WaitAction,
+    actions.PickupAction,
+    actions.ItemAction,
+    actions.DropItem,
+    actions.TakeStairsAction,
+    actions.BumpAction,
+    actions.MovementAction,
+    actions.MeleeAction,
+)
+
+_UINT64 = (1 << 64) - 1
+
+
+def journal_path(save_filename: str) -> str:
+    """Return the path of the journal kept alongside a save"""
+    return os.path.splitext(save_filename)[0] + ".journal"
+
+
+def rng_check(rng: RandomStreams) -> int:
+    """Return a 64 bit digest of the state of the game's generators"""
+    check = 0
+    for generator in (rng.map, rng.spawn, rng.ai):
+        state = generator.bit_generator.state["state"]
+        check = (check * 0x100000001B3) ^ state["state"] ^ state["inc"]
+    return check & _UINT64
+
+
+class Journal:
+    """
+    Appends records to a journal file. Each record is flushed as it is
+    written, so the journal survives the game crashing, though not the
+    whole system going down before the OS writes it out.
+    """
+
+    def __init__(self, f: BinaryIO):
+        self.f = f
+
+
+    @classmethod
+    def create(cls, path: str, engine: Engine, records: bytes = b"") -> Journal:
+        """
+        Start a new journal for `engine` at `path` holding `records`.
+        It replaces any journal already there once it is written.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix=".journal_", dir=directory)
+        try:
+            f = os.fdopen(fd, "wb")
+            f.write(HEADER.pack(MAGIC, JOURNAL_VERSION, engine.rng.seed & _UINT64))
+            f.write(records)
+            f.flush()
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return cls(f)
+
+
+    def entry(self, action: actions.Action, engine: Engine) -> bytes:
+        """
+        Return the record of an action the player is about to perform.
+        It must be taken before the action changes the inventory or RNG.
+        """
+        action_type = ACTION_TYPES.index(type(action))
+        dx = dy = 0
+        item = -1
+        target_x = target_y = 0
+        if isinstance(action, actions.ActionWithDirection):
+            dx, dy = action.dx, action.dy
+        if isinstance(action, actions.ItemAction):
+            item = action.entity.inventory.items.index(action.item)
+            target_x, target_y = action.target_xy
+        return RECORD.pack(
+            engine.turn, action_type, dx, dy, item, target_x, target_y, rng_check(engine.rng)
+        )
+
+
+    def append(self, entry: bytes) -> None:
+        """Append a record from `entry` once its turn has been played"""
+        self.f.write(entry)
+        self.f.flush()
+
+
+    def close(self) -> None:
+        self.f.close()
+
+
+def read_records(path: str, engine: Engine) -> Iterator[bytes]:
+    """
+    Yield the records of the journal at `path`, if it is a journal of
+    `engine`'s game. A record cut short by a crash is left out.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    if len(data) < HEADER.size:
+        return
+    magic, version, seed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != JOURNAL_VERSION or seed != engine.rng.seed & _UINT64:
+        return
+    end = len(data) - (len(data) - HEADER.size) % RECORD.size
+    for offset in range(HEADER.size, end, RECORD.size):
+        yield data[offset:offset + RECORD.size]
+
+
+def _decode_action(
+        action_type: int, dx: int, dy: int, item: int, target: Tuple[int, int], engine: Engine
+) -> Optional[actions.Action]:
+    """Return the player's action from a record, or None if it can't be made"""
+    player = engine.player
+    if action_type >= len(ACTION_TYPES):
+        return None
+    action_class = ACTION_TYPES[action_type]
+    if issubclass(action_class, actions.ActionWithDirection):
+        return action_class(player, dx, dy)
+    if issubclass(action_class, actions.ItemAction):
+        if not 0 <= item < len(player.inventory.items):
+            return None
+        return action_class(player, player.inventory.items[item], target)
+    return action_class(player)
+
+
+def replay(path: str, engine: Engine) -> bytes:
+    """
+    Replay the journal at `path` onto `engine`, loaded from a save.
+    Records from before the save's turn are skipped. Returns the records
+    which were replayed, for the journal to be started again with.
+    """
+    handler = input_handlers.EventHandler(engine)
+    replayed = []
+    for record in read_records(path, engine):
+        turn, action_type, dx, dy, item, target_x, target_y, check = RECORD.unpack(record)
+        if turn < engine.turn:
+            continue
+        if turn != engine.turn or check != rng_check(engine.rng) or not engine.player.is_alive:
+            break
+        action = _decode_action(action_type, dx, dy, item, (target_x, target_y), engine)
+        if action is None or not handler.handle_action(action):
+            break
+        replayed.append(record)
+    return b"".join(replayed)
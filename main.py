@@ -1,21 +1,49 @@
 #!/usr/bin/env python3
 import traceback
+from typing import Optional
 
 import tcod
 
 import color
 import exceptions
 import input_handlers
+from savefile import BackgroundSaver, remove_save
 import setup_game
 
 
-def save_game(handler: input_handlers.BaseEventHandler, filename: str) -> None:
-    """If current event handler has an active Engine, save it."""
+# Turns the player takes between autosaves
+AUTOSAVE_INTERVAL = 50
+
+
+def save_filename(handler: input_handlers.BaseEventHandler) -> Optional[str]:
+    """Return the save slot file of the current event handler's Engine, if it has one"""
     if isinstance(handler, input_handlers.EventHandler):
-        handler.engine.save_as(filename)
+        return handler.engine.save_filename
+    return None
+
+
+def save_game(handler: input_handlers.BaseEventHandler, saver: BackgroundSaver) -> None:
+    """If current event handler has an active Engine, save it and wait for the save."""
+    filename = save_filename(handler)
+    if isinstance(handler, input_handlers.EventHandler) and filename is not None:
+        saver.save(handler.engine, filename)
+        saver.wait()
         print("Game saved.")
 
 
+def autosave(handler: input_handlers.BaseEventHandler, saver: BackgroundSaver) -> None:
+    """
+    Save in the background every AUTOSAVE_INTERVAL turns. Called between
+    events, when the player's turn and the enemies' turns after it are done.
+    """
+    filename = save_filename(handler)
+    if isinstance(handler, input_handlers.EventHandler) and filename is not None:
+        engine = handler.engine
+        if engine.player.is_alive and engine.turn >= engine.last_autosave + AUTOSAVE_INTERVAL:
+            engine.last_autosave = engine.turn
+            saver.save(engine, filename)
+
+
 def main() -> None:
     screen_width = 80
     screen_height = 50
@@ -34,6 +62,7 @@ def main() -> None:
         vsync=True,
     ) as context:
         root_console = tcod.console.Console(screen_width, screen_height, order="F")
+        saver = BackgroundSaver()
         try:
             while True:
                 root_console.clear()
@@ -44,6 +73,7 @@ def main() -> None:
                     for event in tcod.event.wait():
                         context.convert_event(event)
                         handler = handler.handle_events(event)
+                    autosave(handler, saver)
                 except Exception:
                     traceback.print_exc() # Print error to stderr
                     # Print error to message log
@@ -52,13 +82,28 @@ def main() -> None:
                             traceback.format_exc(), color.error
                         )
         except exceptions.QuitWithoutSaving:
+            # An autosave still being written would bring back the deleted save
+            saver.close()
+            if isinstance(handler, input_handlers.EventHandler):
+                engine = handler.engine
+                if engine.journal is not None:
+                    engine.journal.close()
+                if engine.save_filename is not None:
+                    remove_save(engine.save_filename)
             raise
         except SystemExit:
-            save_game(handler, "savegame.sav")
+            save_game(handler, saver)
             raise
         except BaseException: # save on any unexpected exception
-            save_game(handler, "savegame.sav")
+            save_game(handler, saver)
             raise
+        finally:
+            # Let any autosave still being written finish
+            saver.close()
+            if isinstance(handler, input_handlers.EventHandler):
+                if handler.engine.journal is not None:
+                    handler.engine.journal.close()
+                handler.engine.game_world.close()
 
 
 if __name__ == "__main__":
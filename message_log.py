@@ -1,4 +1,4 @@
-from typing import Iterable, List, Reversible, Tuple
+from typing import Callable, Iterable, List, Optional, Reversible, Tuple
 import textwrap
 
 import tcod
@@ -25,7 +25,42 @@ class Message:
 
 class MessageLog:
     def __init__(self) -> None:
-        self.messages: List[Message] = []
+        self._messages: List[Message] = []
+        # Loads the messages from before `_messages`, until they are needed
+        self._load_older: Optional[Callable[[], List[Message]]] = None
+
+
+    @property
+    def messages(self) -> List[Message]:
+        """Every message in this log, oldest first"""
+        if self._load_older is not None:
+            self._messages[:0] = self._load_older()
+            self._load_older = None
+        return self._messages
+
+
+    def loaded_messages(
+            self
+    ) -> Tuple[Optional[Callable[[], List[Message]]], List[Message]]:
+        """
+        Return what loads the older messages if they haven't been loaded
+        yet, otherwise None, and the messages after them. Unlike `messages`
+        this doesn't load the older messages.
+        """
+        return self._load_older, self._messages
+
+
+    def restore(
+            self, recent: List[Message], load_older: Optional[Callable[[], List[Message]]]
+    ) -> None:
+        """
+        Replace the log with the `recent` messages of a loaded game.
+        `load_older` is called for the messages before them when they are
+        first needed, which rendering the log doesn't do if there are enough
+        recent ones.
+        """
+        self._messages = recent
+        self._load_older = load_older
 
 
     def add_message(
@@ -40,10 +75,11 @@ class MessageLog:
         If `stack` is True then the message can stack with a previous message
         of the same text
         """
-        if stack and self.messages and text == self.messages[-1].plain_text:
-            self.messages[-1].count += 1
+        messages = self._messages or self.messages
+        if stack and messages and text == messages[-1].plain_text:
+            messages[-1].count += 1
         else:
-            self.messages.append(Message(text, fg))
+            messages.append(Message(text, fg))
 
     
     def render(
@@ -58,7 +94,12 @@ class MessageLog:
         `x`, `y`, `width`, `height` is the rectagular region to render
         onto the `console`
         """
-        self.render_messages(console, x, y, width, height, self.messages)
+        # Each message takes at least one line
+        if len(self._messages) >= height:
+            messages = self._messages
+        else:
+            messages = self.messages
+        self.render_messages(console, x, y, width, height, messages)
 
 
     @staticmethod
@@ -1,22 +1,52 @@
 from __future__ import annotations
 
-import random
-from typing import Iterator, List, Tuple, TYPE_CHECKING
+import functools
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TYPE_CHECKING
 
 import numpy as np
 import tcod
 
+from chunked_array import CHUNK_SIZE, ChunkedArray
+from connectivity import Connectivity, connect_regions, label_regions
 import entity_factories
 from game_map import GameMap
+from rng import MAP_STREAM
 import tile_types
 
 if TYPE_CHECKING:
     from engine import Engine
+    from rng import RandomStreams
 
 
 COLUMN_ROOM_CHANCE = 0.6
 IRREGULAR_ROOM_CHANCE = 0.5
-SPAWN_ATTEMPTS = 5
+# Taken positions RoomGrid skips before rebuilding its table of free space
+STALE_POSITION_LIMIT = 32
+
+# Cave generator settings
+# Chance for each tile to start as a wall
+CAVE_WALL_CHANCE = 0.45
+# Rounds of the cellular automaton
+CAVE_STEPS = 4
+# A floor tile becomes a wall with at least CAVE_BIRTH wall neighbours,
+# a wall stays a wall with at least CAVE_SURVIVAL
+CAVE_BIRTH = 5
+CAVE_SURVIVAL = 4
+# Width and height of the area of a chunked cave map generated with the floor
+CAVE_START_AREA = 128
+
+# Entities place_entities spawns, with the upper bound of the spawn roll
+# for each one but the last, which spawns on any higher roll
+MONSTERS = (entity_factories.orc, entity_factories.troll)
+MONSTER_CHANCES = np.array([0.8])
+ITEMS = (
+    entity_factories.health_potion,
+    entity_factories.fireball_scroll,
+    entity_factories.confusion_scroll,
+    entity_factories.lightning_scroll,
+)
+ITEM_CHANCES = np.array([0.4, 0.8, 0.89])
 
 class RectangularRoom:
     def __init__(self, x: int, y: int, width: int, height: int):
@@ -50,7 +80,7 @@ class RectangularRoom:
     
     def dig_room(self, dungeon: GameMap) -> None:
         # Dig out room inner area
-        dungeon.tiles[self.inner] = tile_types.floor
+        dungeon.set_tiles(self.inner, tile_types.floor)
 
 
 class IrregularRoom(RectangularRoom):
@@ -68,14 +98,29 @@ class IrregularRoom(RectangularRoom):
     def inner(self) -> Tuple[slice, slice]:
         return super().inner
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def stamp(width: int, height: int, phase_x: int, phase_y: int) -> np.ndarray:
+        """
+        Return a mask of the tiles dug out of a room's full area
+        A tile is left solid where both its x % width and y % height are below 3,
+        `phase_x` and `phase_y` are the room's x1 % width and y1 % height
+        """
+        solid_x = (np.arange(phase_x, phase_x + width) % width) // 3 == 0
+        solid_y = (np.arange(phase_y, phase_y + height) % height) // 3 == 0
+        mask = ~(solid_x[:, np.newaxis] & solid_y[np.newaxis, :])
+        mask.flags.writeable = False # Shared between rooms
+        return mask
+
     def dig_room(self, dungeon: GameMap) -> None:
         # Dig out room inner area
-        for x in range(self.x1, self.x2):
-            for y in range(self.y1, self.y2):
-                if x % self.width // 3 == 0 and y % self.height // 3 == 0:
-                    continue
-                else:
-                    dungeon.tiles[x, y] = tile_types.floor
+        dungeon.set_tiles(
+            (slice(self.x1, self.x2), slice(self.y1, self.y2)),
+            tile_types.floor,
+            where=self.stamp(
+                self.width, self.height, self.x1 % self.width, self.y1 % self.height
+            ),
+        )
 
 
 class ColumnRoom(RectangularRoom):
@@ -92,88 +137,237 @@ class ColumnRoom(RectangularRoom):
     def inner(self) -> Tuple[slice, slice]:
         return super().inner
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def stamp(width: int, height: int, phase_x: int, phase_y: int) -> np.ndarray:
+        """
+        Return a mask of the tiles dug out of a room's area, 2 tiles in from its edges
+        Columns are left on tiles with both an even x and even y,
+        `phase_x` and `phase_y` are the parity of the room's x1 and y1
+        """
+        column_x = (np.arange(phase_x, phase_x + width - 4) % 2) == 0
+        column_y = (np.arange(phase_y, phase_y + height - 4) % 2) == 0
+        mask = ~(column_x[:, np.newaxis] & column_y[np.newaxis, :])
+        mask.flags.writeable = False # Shared between rooms
+        return mask
+
     def dig_room(self, dungeon: GameMap) -> None:
         # Dig out room inner area
-        for x in range(self.x1 + 2, self.x2 - 2):
-            for y in range(self.y1 + 2, self.y2 - 2):
-                if x % 2 == 0 and y % 2 == 0:
-                    continue
-                else:
-                    dungeon.tiles[x, y] = tile_types.floor
+        dungeon.set_tiles(
+            (slice(self.x1 + 2, self.x2 - 2), slice(self.y1 + 2, self.y2 - 2)),
+            tile_types.floor,
+            where=self.stamp(self.width, self.height, self.x1 % 2, self.y1 % 2),
+        )
 
 
-def place_entities(
-        room: RectangularRoom, dungeon: GameMap, max_monsters: int, max_items: int
-) -> None:
-    number_of_monsters = random.randint(0, max_monsters)
-    number_of_items = random.randint(0, max_items)
+# Room classes, in the order of the room chances roll_rooms picks them by
+ROOM_TYPES = (IrregularRoom, ColumnRoom, RectangularRoom)
 
-    spawnable = np.array(dungeon.tiles["walkable"], dtype=np.int8)
 
-    for i in range(number_of_monsters):
-        x, y, counter = 0, 0, 0
-        
-        while not spawnable[x, y] and counter < SPAWN_ATTEMPTS:
-            x = random.randint(room.x1 + 1, room.x2 - 1)
-            y = random.randint(room.y1 + 1, room.y2 - 1)
-            counter += 1
-
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities) and spawnable[x, y]:
-            if random.random() < 0.8:
-                entity_factories.orc.spawn(dungeon, x, y)
-            else:
-                entity_factories.troll.spawn(dungeon, x, y)
+class RoomGrid:
+    """
+    Tracks the tiles covered by placed rooms, including their walls.
+    Overlap checks cost the area of the room instead of the number of rooms.
+    """
 
-    for i in range(number_of_items):
-        x, y, counter = 0, 0, 0
-        
-        while not spawnable[x, y] and counter < SPAWN_ATTEMPTS:
-            x = random.randint(room.x1 + 1, room.x2 - 1)
-            y = random.randint(room.y1 + 1, room.y2 - 1)
-            counter += 1
-
-        if not any(entity.x == x and entity.y == y for entity in dungeon.entities) and spawnable[x, y]:
-            item_chance = random.random()
-
-            if item_chance < 0.4:
-                entity_factories.health_potion.spawn(dungeon, x, y)
-            elif item_chance < 0.8:
-                entity_factories.fireball_scroll.spawn(dungeon, x, y)
-            elif item_chance < 0.89:
-                entity_factories.confusion_scroll.spawn(dungeon, x, y)
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.occupied = np.zeros((width, height), dtype=bool, order="F")
+        # Incremented whenever a room is added
+        self.version = 0
+
+        # Summed area table of `occupied` as of `_table_version`
+        self._table = np.zeros((width + 1, height + 1), dtype=np.int32)
+        self._table_version = 0
+        # Shuffled positions which were free for each room size, and how
+        # many of them are left, as of the summed area table
+        self._free_positions: Dict[Tuple[int, int], Tuple[np.ndarray, int]] = {}
+
+    def intersects(self, room: RectangularRoom) -> bool:
+        """Return True if the room overlaps any room in this grid"""
+        return bool(self.occupied[room.x1 : room.x2 + 1, room.y1 : room.y2 + 1].any())
+
+    def add(self, room: RectangularRoom) -> None:
+        self.occupied[room.x1 : room.x2 + 1, room.y1 : room.y2 + 1] = True
+        self.version += 1
+
+    def sample_position(
+            self, width: int, height: int, rng: np.random.Generator
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Return a random position where a room of the given size would not
+        overlap any placed room, or None if there is no space left for it
+        """
+        while True:
+            if (width, height) not in self._free_positions:
+                self._free_positions[width, height] = self._find_free_positions(width, height)
+            positions, remaining = self._free_positions[width, height]
+
+            rejected = 0
+            while remaining and rejected < STALE_POSITION_LIMIT:
+                # Take a random remaining position, swapping the last one into its place
+                i = int(rng.integers(remaining))
+                x, y = positions[i]
+                remaining -= 1
+                positions[i] = positions[remaining]
+                if not self.occupied[x : x + width + 1, y : y + height + 1].any():
+                    self._free_positions[width, height] = positions, remaining
+                    return int(x), int(y)
+                rejected += 1
+            self._free_positions[width, height] = positions, remaining
+
+            if self._table_version == self.version:
+                # The table is current, so every position left is free
+                if not remaining:
+                    return None
             else:
-                entity_factories.lightning_scroll.spawn(dungeon, x, y)
+                # Too many positions were taken by rooms added since the table was built
+                self._rebuild_table()
+
+    def _rebuild_table(self) -> None:
+        self._table[1:, 1:] = self.occupied.cumsum(axis=0).cumsum(axis=1)
+        self._table_version = self.version
+        self._free_positions.clear()
+
+    def _find_free_positions(self, width: int, height: int) -> Tuple[np.ndarray, int]:
+        """Return every position where a room of this size fits, according to the table"""
+        # A room covers width + 1 by height + 1 tiles, counting both walls
+        # and must leave one tile free on the right and bottom map edges
+        span_x, span_y = width + 1, height + 1
+        count_x, count_y = self.width - span_x, self.height - span_y
+        if count_x <= 0 or count_y <= 0:
+            return np.zeros((0, 2), dtype=np.int32), 0
+        table = self._table
+        covered = (
+            table[span_x : span_x + count_x, span_y : span_y + count_y]
+            - table[:count_x, span_y : span_y + count_y]
+            - table[span_x : span_x + count_x, :count_y]
+            + table[:count_x, :count_y]
+        )
+        positions = np.argwhere(covered == 0)
+        return positions, len(positions)
+
+
+def place_entities(
+        room: RectangularRoom,
+        dungeon: GameMap,
+        max_monsters: int,
+        max_items: int,
+        free_cells: np.ndarray,
+        rng: np.random.Generator,
+) -> None:
+    """
+    Spawn monsters and items on distinct tiles of the room's inner area.
+    `free_cells` is True for tiles of the map which nothing has been placed on,
+    it is updated with the tiles used here.
+    """
+    left, top = room.x1 + 1, room.y1 + 1
+    area = room.inner
+    candidates = np.argwhere(dungeon.walkable[area] & free_cells[area])
+
+    # Everything spawned in the room is rolled in one draw:
+    # the numbers of monsters and items, a sort key for each candidate
+    # tile and which entity spawns on each chosen tile
+    rolls = rng.random(2 + len(candidates) + max_monsters + max_items)
+    number_of_monsters = int(rolls[0] * (max_monsters + 1))
+    number_of_items = int(rolls[1] * (max_items + 1))
+    position_keys = rolls[2 : 2 + len(candidates)]
+    kinds = rolls[2 + len(candidates) :]
+
+    count = min(number_of_monsters + number_of_items, len(candidates))
+    # Monsters take the first positions drawn, items the rest
+    chosen = candidates[position_keys.argsort()[:count]] + (left, top)
+    free_cells[chosen[:, 0], chosen[:, 1]] = False
+    positions = chosen.tolist()
+
+    monster_kinds = MONSTER_CHANCES.searchsorted(kinds[:number_of_monsters], side="right")
+    item_kinds = ITEM_CHANCES.searchsorted(
+        kinds[number_of_monsters:count], side="right"
+    )
+
+    for (x, y), kind in zip(positions[:number_of_monsters], monster_kinds.tolist()):
+        MONSTERS[kind].spawn(dungeon, x, y)
+
+    for (x, y), kind in zip(positions[number_of_monsters:], item_kinds.tolist()):
+        ITEMS[kind].spawn(dungeon, x, y)
 
 
 def tunnel_between(
-        start: Tuple[int, int], end: Tuple[int, int]
-) -> Iterator[Tuple[int, int]]:
-    """Return an L-shaped tunnel between two points"""
+        start: Tuple[int, int], end: Tuple[int, int], horizontal_first: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the x and y index arrays of an L-shaped tunnel between two points"""
     x1, y1 = start
     x2, y2 = end
-    if random.random() < 0.5: # 50/50
+    if horizontal_first:
         # tunnel horizontal then vertical
         corner_x, corner_y = x2, y1
     else:
         # tunnel vertical then horizontal
         corner_x, corner_y = x1, y2
     
-    # Generate coordinates for tunnel
-    skip_initial_tiles = 2
-    for x, y in tcod.los.bresenham((x1 , y1), (corner_x, corner_y)).tolist():
-        if  skip_initial_tiles > 0:
-            skip_initial_tiles -= 1
-            continue
-        yield x, y
-    tunnel_2 = tcod.los.bresenham((corner_x, corner_y), (x2, y2)).tolist()
-    end_length = len(tunnel_2)
-    for x, y in tunnel_2:
-        end_length -= 1
-        if end_length < 2:
-            continue
-        yield x, y
+    # Generate coordinates for tunnel, leaving the ends inside the rooms
+    tunnel_1 = tcod.los.bresenham((x1, y1), (corner_x, corner_y))[2:]
+    tunnel_2 = tcod.los.bresenham((corner_x, corner_y), (x2, y2))[:-2]
+    tunnel = np.concatenate([tunnel_1, tunnel_2])
+    return tunnel[:, 0], tunnel[:, 1]
+
+
+def carve_tunnels(
+        dungeon: GameMap, tunnels: List[Tuple[np.ndarray, np.ndarray]]
+) -> None:
+    """Dig out all of the given tunnels with a single write"""
+    if not tunnels:
+        return
+    dungeon.set_tiles(
+        (
+            np.concatenate([x for x, _ in tunnels]),
+            np.concatenate([y for _, y in tunnels]),
+        ),
+        tile_types.floor,
+    )
+
+
+def roll_rooms(
+        rng: np.random.Generator,
+        count: int,
+        min_size: int,
+        max_width: Any,
+        max_height: Any,
+) -> Tuple[List[Type[RectangularRoom]], np.ndarray, np.ndarray]:
+    """
+    Roll the types and sizes of `count` rooms, the first is always rectangular
+    The maximum sizes can be numbers or arrays with one size per room
+    Column rooms are one tile larger and odd sized, so up to 2 over the maximum
+    """
+    widths = rng.integers(min_size, max_width, size=count, endpoint=True)
+    heights = rng.integers(min_size, max_height, size=count, endpoint=True)
+    room_chances = rng.random(count)
+    room_chances[:1] = 1
+    types = np.searchsorted(
+        (IRREGULAR_ROOM_CHANCE, COLUMN_ROOM_CHANCE), room_chances, side="left"
+    )
+    column_rooms = types == 1
+    widths[column_rooms] = (widths[column_rooms] + 1) | 1
+    heights[column_rooms] = (heights[column_rooms] + 1) | 1
+    return [ROOM_TYPES[t] for t in types.tolist()], widths, heights
+
+
+def finish_dungeon(
+        dungeon: GameMap,
+        rooms: List[RectangularRoom],
+        tunnels: List[Tuple[np.ndarray, np.ndarray]],
+        downstairs: Tuple[int, int],
+) -> None:
+    """Dig the tunnels, place the down stairs and join any cut off regions"""
+    carve_tunnels(dungeon, tunnels)
+
+    dungeon.set_tiles(downstairs, tile_types.down_stairs)
+    dungeon.downstairs_location = downstairs
+    dungeon.room_count = len(rooms)
+    # Pillars and overlapping tunnels can cut off parts of the floor
+    dungeon.connectivity = connect_regions(dungeon, dungeon.upstairs_location)
 
-    
 
 def generate_dungeon(
         max_rooms: int,
@@ -183,50 +377,59 @@ def generate_dungeon(
         map_height: int,
         max_monsters_per_room: int,
         max_items_per_room: int,
-        engine: Engine
+        engine: Engine,
+        rng: RandomStreams,
+        sample_free_space: bool = False,
 ) -> GameMap:
-    """Generate a new dungeon map"""
+    """
+    Generate a new dungeon map
+    Rooms are placed at random positions and discarded if they overlap,
+    or if `sample_free_space` is True only at positions with space for them
+    The layout is rolled from `rng.map` and entities from `rng.spawn`
+    """
     player = engine.player
-    dungeon = GameMap(engine, map_width, map_height, entities=[player])
+    dungeon = GameMap(engine, map_width, map_height)
+    room_grid = RoomGrid(map_width, map_height)
+    # Tiles which no entity has been placed on
+    free_cells = np.ones((map_width, map_height), dtype=bool, order="F")
 
     rooms: List[RectangularRoom] = []
+    # Tunnels are dug together once every room is placed
+    tunnels: List[Tuple[np.ndarray, np.ndarray]] = []
     center_of_last_room = (0, 0)
     last_room: RectangularRoom
 
-    for r in range(max_rooms):
-        room_width = random.randint(room_min_size, room_max_size)
-        room_height = random.randint(room_min_size, room_max_size)
-
-        x = random.randint(0, dungeon.width - room_width - 1)
-        y = random.randint(0, dungeon.height - room_height - 1)
+    # Roll every room attempt up front
+    room_types, room_widths, room_heights = roll_rooms(
+        rng.map, max_rooms, room_min_size, room_max_size, room_max_size
+    )
+    if not sample_free_space:
+        room_xs = rng.map.integers(0, dungeon.width - room_widths)
+        room_ys = rng.map.integers(0, dungeon.height - room_heights)
+    extra_tunnel_rolls, extra_tunnel_targets = rng.map.random((2, max_rooms))
+    # Which way the tunnel to the previous room and the extra tunnel turn
+    tunnel_turns, extra_tunnel_turns = rng.map.random((2, max_rooms)) < 0.5
 
-        room_chance = random.random()
-        if len(rooms) == 0:
-            room_chance = 1
-
-        if room_chance <= IRREGULAR_ROOM_CHANCE:
-            new_room = IrregularRoom(x, y, room_width, room_height)
-
-        elif room_chance <= COLUMN_ROOM_CHANCE:
-            room_width += 1
-            room_height += 1
-
-            x = random.randint(0, dungeon.width - room_width - 1)
-            y = random.randint(0, dungeon.height - room_height - 1)
-
-            if room_width % 2 == 0:
-                room_width += 1
-            if room_height % 2 == 0:
-                room_height += 1
-            new_room = ColumnRoom(x, y, room_width, room_height)
-            
+    for r in range(max_rooms):
+        room_width = int(room_widths[r])
+        room_height = int(room_heights[r])
+        room_type = room_types[r]
+
+        if sample_free_space:
+            position = room_grid.sample_position(room_width, room_height, rng.map)
+            if position is None:
+                continue # No space left for a room of this size
+            x, y = position
         else:
-            new_room = RectangularRoom(x, y, room_width, room_height)
+            x, y = int(room_xs[r]), int(room_ys[r])
+
+        new_room = room_type(x, y, room_width, room_height)
 
         # Check if new room intersects any existing room
-        if any(new_room.intersects(other_room) for other_room in rooms):
+        if room_grid.intersects(new_room):
             continue # room intersects, go to next attempt
         # no intersections, proceed
+        room_grid.add(new_room)
 
         # Dig out room inner area
         new_room.dig_room(dungeon)
@@ -234,27 +437,372 @@ def generate_dungeon(
         if len(rooms) == 0:
             # First room, set player coords
             player.place(*new_room.center, dungeon)
+            dungeon.upstairs_location = new_room.center
+            free_cells[new_room.center] = False
         else:
             # Dig tunnel between this and previous room
-            for x, y in tunnel_between(rooms[-1].center, new_room.center):
-                dungeon.tiles[x,y] = tile_types.floor
+            tunnels.append(tunnel_between(rooms[-1].center, new_room.center, tunnel_turns[r]))
 
             center_of_last_room = new_room.center
         
         extra_tunnel_chance = 0.15
-        if random.random() <= extra_tunnel_chance and len(rooms) > 2 or r == max_rooms - 1:
-            for x, y in tunnel_between(rooms[random.randint(0, len(rooms) - 1)].center, last_room.center):
-                dungeon.tiles[x,y] = tile_types.floor
-
-        place_entities(new_room, dungeon, max_monsters_per_room, max_items_per_room)
+        if extra_tunnel_rolls[r] <= extra_tunnel_chance and len(rooms) > 2 or r == max_rooms - 1:
+            target = rooms[int(extra_tunnel_targets[r] * len(rooms))]
+            tunnels.append(
+                tunnel_between(target.center, last_room.center, extra_tunnel_turns[r])
+            )
+
+        place_entities(
+            new_room, dungeon, max_monsters_per_room, max_items_per_room, free_cells, rng.spawn
+        )
 
         
         # Append new room to list
         rooms.append(new_room)
         last_room = new_room
-        
-    dungeon.tiles[center_of_last_room] = tile_types.down_stairs
-    dungeon.downstairs_location = center_of_last_room
 
+    finish_dungeon(dungeon, rooms, tunnels, center_of_last_room)
     return dungeon
 
+
+def partition_map(
+        map_width: int,
+        map_height: int,
+        min_leaf: int,
+        max_leaf: int,
+        split_rolls: np.ndarray,
+) -> Tuple[List[Tuple[int, int, int, int]], List[Tuple[int, int, int]]]:
+    """
+    Split the map into (x, y, width, height) areas by binary space partitioning
+    The largest area is split first, across its longer side where possible,
+    until every area is at most `max_leaf` tiles across or can't be split
+    into two of at least `min_leaf`, or a roll from `split_rolls` runs out
+    Returns every area and the (area, first part, second part) of each split
+    """
+    areas = [(0, 0, map_width, map_height)]
+    splits: List[Tuple[int, int, int]] = []
+    queue = [(-map_width * map_height, 0)]
+    while queue and len(splits) < len(split_rolls):
+        _, area = heapq.heappop(queue)
+        x, y, width, height = areas[area]
+        can_split_x = width > max_leaf and width >= 2 * min_leaf
+        can_split_y = height > max_leaf and height >= 2 * min_leaf
+        if not (can_split_x or can_split_y):
+            continue # A leaf, which is never split
+
+        roll = split_rolls[len(splits)]
+        if can_split_x and (width >= height or not can_split_y):
+            cut = min_leaf + int(roll * (width - 2 * min_leaf + 1))
+            parts = [(x, y, cut, height), (x + cut, y, width - cut, height)]
+        else:
+            cut = min_leaf + int(roll * (height - 2 * min_leaf + 1))
+            parts = [(x, y, width, cut), (x, y + cut, width, height - cut)]
+
+        splits.append((area, len(areas), len(areas) + 1))
+        for part in parts:
+            heapq.heappush(queue, (-part[2] * part[3], len(areas)))
+            areas.append(part)
+    return areas, splits
+
+
+def generate_bsp_dungeon(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        max_monsters_per_room: int,
+        max_items_per_room: int,
+        engine: Engine,
+        rng: RandomStreams,
+) -> GameMap:
+    """
+    Generate a new dungeon map by binary space partitioning
+    The map is split into up to `max_rooms` areas with one room in each,
+    so no room is ever rejected, and the two sides of every split are
+    joined by a tunnel
+    The layout is rolled from `rng.map` and entities from `rng.spawn`
+    """
+    player = engine.player
+    dungeon = GameMap(engine, map_width, map_height)
+    free_cells = np.ones((map_width, map_height), dtype=bool, order="F")
+
+    # An area fits a room with its walls, column rooms need 2 extra tiles
+    areas, splits = partition_map(
+        map_width,
+        map_height,
+        min_leaf=room_min_size + 3,
+        max_leaf=room_max_size + 3,
+        split_rolls=rng.map.random(max(max_rooms - 1, 0)),
+    )
+    split_areas = {area for area, _, _ in splits}
+    leaf_areas = [i for i in range(len(areas)) if i not in split_areas]
+    leaf_x, leaf_y, leaf_width, leaf_height = np.array(
+        [areas[i] for i in leaf_areas], dtype=np.int64
+    ).reshape(-1, 4).T
+
+    room_types, room_widths, room_heights = roll_rooms(
+        rng.map,
+        len(leaf_areas),
+        room_min_size,
+        np.clip(leaf_width - 3, room_min_size, room_max_size),
+        np.clip(leaf_height - 3, room_min_size, room_max_size),
+    )
+    room_xs = leaf_x + rng.map.integers(0, leaf_width - room_widths)
+    room_ys = leaf_y + rng.map.integers(0, leaf_height - room_heights)
+    tunnel_turns = rng.map.random(len(splits)) < 0.5
+
+    rooms: List[RectangularRoom] = []
+    # Room of each area, a room of any leaf inside it for split areas
+    area_rooms: Dict[int, RectangularRoom] = {}
+    for area, room_type, x, y, width, height in zip(
+        leaf_areas,
+        room_types,
+        room_xs.tolist(),
+        room_ys.tolist(),
+        room_widths.tolist(),
+        room_heights.tolist(),
+    ):
+        room = room_type(x, y, width, height)
+        room.dig_room(dungeon)
+        if not rooms:
+            player.place(*room.center, dungeon)
+            dungeon.upstairs_location = room.center
+            free_cells[room.center] = False
+        place_entities(
+            room, dungeon, max_monsters_per_room, max_items_per_room, free_cells, rng.spawn
+        )
+        rooms.append(room)
+        area_rooms[area] = room
+
+    # Parts are split after their parent, so walk the splits backwards
+    tunnels: List[Tuple[np.ndarray, np.ndarray]] = []
+    for (area, first, second), horizontal_first in zip(reversed(splits), tunnel_turns):
+        tunnels.append(
+            tunnel_between(area_rooms[first].center, area_rooms[second].center, horizontal_first)
+        )
+        area_rooms[area] = area_rooms[first]
+
+    finish_dungeon(dungeon, rooms, tunnels, rooms[-1].center)
+    return dungeon
+
+
+def count_wall_neighbours(walls: np.ndarray) -> np.ndarray:
+    """
+    Return how many of the 8 neighbours of each tile are walls
+    Tiles outside the map count as walls
+    """
+    padded = np.pad(walls.view(np.uint8), 1, constant_values=1)
+    # Sum each 3x3 block as a sum of columns then of rows, minus the middle tile
+    columns = padded[:-2] + padded[1:-1] + padded[2:]
+    return columns[:, :-2] + columns[:, 1:-1] + columns[:, 2:] - walls
+
+
+def step_cave(walls: np.ndarray) -> np.ndarray:
+    """Run CAVE_STEPS rounds of the cave cellular automaton on a wall mask"""
+    for _ in range(CAVE_STEPS):
+        neighbours = count_wall_neighbours(walls)
+        walls = (neighbours >= CAVE_BIRTH) | (walls & (neighbours >= CAVE_SURVIVAL))
+    return walls
+
+
+def populate_cave(
+        dungeon: GameMap,
+        cave: np.ndarray,
+        origin: Tuple[int, int],
+        max_rooms: int,
+        room_max_size: int,
+        max_monsters_per_room: int,
+        max_items_per_room: int,
+        free_cells: Any,
+        rng: RandomStreams,
+) -> None:
+    """
+    Place the player, the stairs and entities in a cave. `cave` is True for
+    the cave's tiles in an area of the map starting at `origin`.
+    The player starts anywhere in the cave and the down stairs are at the
+    furthest point from them. Entities are placed in up to `max_rooms`
+    squares `room_max_size` tiles across, which take the place of rooms.
+    """
+    left, top = origin
+    cave_xs, cave_ys = np.nonzero(cave)
+    cave_xs += left
+    cave_ys += top
+    start = int(rng.map.integers(len(cave_xs)))
+    start_x, start_y = int(cave_xs[start]), int(cave_ys[start])
+    end = int(((cave_xs - start_x) ** 2 + (cave_ys - start_y) ** 2).argmax())
+    downstairs = int(cave_xs[end]), int(cave_ys[end])
+    dungeon.engine.player.place(start_x, start_y, dungeon)
+    dungeon.upstairs_location = start_x, start_y
+    dungeon.set_tiles(downstairs, tile_types.down_stairs)
+    dungeon.downstairs_location = downstairs
+    free_cells[dungeon.upstairs_location] = False
+    free_cells[downstairs] = False
+
+    # Spawn in squares of the area picked from those which are mostly cave
+    size = room_max_size
+    squares_x, squares_y = cave.shape[0] // size, cave.shape[1] // size
+    cave_per_square = (
+        cave[: squares_x * size, : squares_y * size]
+        .reshape(squares_x, size, squares_y, size)
+        .sum(axis=(1, 3))
+    )
+    open_squares = np.flatnonzero(cave_per_square.ravel() * 2 >= size * size)
+    chosen = np.sort(
+        rng.spawn.choice(open_squares, min(max_rooms, len(open_squares)), replace=False)
+    )
+    squares = []
+    for square_x, square_y in zip(*np.unravel_index(chosen, cave_per_square.shape)):
+        # The inner area of a room is inside its walls
+        square = RectangularRoom(
+            left + int(square_x) * size - 1, top + int(square_y) * size - 1, size + 1, size + 1
+        )
+        place_entities(
+            square, dungeon, max_monsters_per_room, max_items_per_room, free_cells, rng.spawn
+        )
+        squares.append(square)
+    dungeon.room_count = len(squares)
+
+
+def generate_cave_dungeon(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        max_monsters_per_room: int,
+        max_items_per_room: int,
+        engine: Engine,
+        rng: RandomStreams,
+) -> GameMap:
+    """
+    Generate a new cave map with a cellular automaton
+    Only the largest cave is kept, so every floor tile is reachable.
+    The player, stairs and entities are placed by populate_cave.
+    The layout is rolled from `rng.map` and entities from `rng.spawn`
+    """
+    dungeon = GameMap(engine, map_width, map_height)
+    free_cells = np.ones((map_width, map_height), dtype=bool, order="F")
+
+    walls = step_cave(rng.map.random((map_width, map_height)) < CAVE_WALL_CHANCE)
+    walls[[0, -1], :] = True
+    walls[:, [0, -1]] = True
+
+    labels, region_count = label_regions(~walls)
+    region_sizes = np.bincount(labels.ravel(), minlength=region_count + 1)
+    region_sizes[0] = 0
+    cave = labels == region_sizes.argmax()
+    dungeon.set_tiles((slice(None), slice(None)), tile_types.floor, where=cave)
+    cave_size = int(region_sizes.max())
+    dungeon.connectivity = Connectivity(region_count, int(region_sizes.sum()) - cave_size, 0)
+
+    populate_cave(
+        dungeon, cave, (0, 0), max_rooms, room_max_size,
+        max_monsters_per_room, max_items_per_room, free_cells, rng,
+    )
+    return dungeon
+
+
+class CaveChunks:
+    """
+    Makes the tiles of a chunked cave map one chunk at a time, as
+    the `generate_tiles` of its GameMap.
+
+    The starting noise of a chunk only depends on the seed and the chunk's
+    position. The automaton is run over the chunk and a CAVE_STEPS wide
+    border of its neighbours' noise, which is as far as a change spreads in
+    that many rounds, so chunks join up seamlessly in any order.
+    """
+
+    def __init__(self, rng: RandomStreams, map_width: int, map_height: int, chunk_size: int):
+        if chunk_size < CAVE_STEPS:
+            raise ValueError(f"Cave chunks must be at least {CAVE_STEPS} tiles across")
+        self.rng = rng
+        self.map_width, self.map_height = map_width, map_height
+        self.chunk_size = chunk_size
+
+
+    def noise(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        """Return the starting walls of a chunk, which are all walls outside the map"""
+        size = self.chunk_size
+        left, top = chunk_x * size, chunk_y * size
+        walls = np.ones((size, size), dtype=bool, order="F")
+        if 0 <= left < self.map_width and 0 <= top < self.map_height:
+            width, height = min(size, self.map_width - left), min(size, self.map_height - top)
+            noise = self.rng.chunk(MAP_STREAM, chunk_x, chunk_y).random((size, size))
+            walls[:width, :height] = noise[:width, :height] < CAVE_WALL_CHANCE
+        return walls
+
+
+    def __call__(self, chunk_x: int, chunk_y: int) -> np.ndarray:
+        size, margin = self.chunk_size, CAVE_STEPS
+        walls = np.block([
+            [self.noise(chunk_x + dx, chunk_y + dy) for dy in (-1, 0, 1)]
+            for dx in (-1, 0, 1)
+        ])[size - margin : 2 * size + margin, size - margin : 2 * size + margin]
+        walls = step_cave(walls)[margin:-margin, margin:-margin]
+
+        # Keep the outer edge of the map solid
+        xs = np.arange(chunk_x * size, (chunk_x + 1) * size)
+        ys = np.arange(chunk_y * size, (chunk_y + 1) * size)
+        walls[(xs == 0) | (xs >= self.map_width - 1), :] = True
+        walls[:, (ys == 0) | (ys >= self.map_height - 1)] = True
+        return np.where(walls, tile_types.wall, tile_types.floor)
+
+
+def generate_chunked_cave_dungeon(
+        max_rooms: int,
+        room_min_size: int,
+        room_max_size: int,
+        map_width: int,
+        map_height: int,
+        max_monsters_per_room: int,
+        max_items_per_room: int,
+        engine: Engine,
+        rng: RandomStreams,
+        chunk_size: int = CHUNK_SIZE,
+) -> GameMap:
+    """
+    Generate a cave map which is only made a chunk at a time as it is
+    explored, for floors too large to generate whole.
+    Only the CAVE_START_AREA tiles across the middle of the map are made up
+    front. The player, stairs and entities are placed in the largest cave
+    there by populate_cave, so the rest of the map may not be reachable.
+    The layout is rolled from `rng.map` and entities from `rng.spawn`
+    """
+    dungeon = GameMap(
+        engine, map_width, map_height, chunk_size=chunk_size,
+        generate_tiles=CaveChunks(rng, map_width, map_height, chunk_size),
+    )
+    free_cells = ChunkedArray((map_width, map_height), bool, True, chunk_size)
+
+    left = max(0, (map_width - CAVE_START_AREA) // 2)
+    top = max(0, (map_height - CAVE_START_AREA) // 2)
+    area = (slice(left, left + CAVE_START_AREA), slice(top, top + CAVE_START_AREA))
+    labels, region_count = label_regions(dungeon.walkable[area])
+    region_sizes = np.bincount(labels.ravel(), minlength=region_count + 1)
+    region_sizes[0] = 0
+    cave = labels == region_sizes.argmax()
+    dungeon.connectivity = Connectivity(
+        region_count, int(region_sizes.sum() - region_sizes.max()), 0
+    )
+
+    populate_cave(
+        dungeon, cave, (left, top), max_rooms, room_max_size,
+        max_monsters_per_room, max_items_per_room, free_cells, rng,
+    )
+    return dungeon
+
+
+# Dungeon generators by the name GameWorld settings use for them
+GENERATORS: Dict[str, Callable[..., GameMap]] = {
+    "rooms": generate_dungeon,
+    "bsp": generate_bsp_dungeon,
+    "cave": generate_cave_dungeon,
+    "chunked_cave": generate_chunked_cave_dungeon,
+}
+
+
+def generate(generator: str, **settings: Any) -> GameMap:
+    """Generate a dungeon map with the generator named `generator` in GENERATORS"""
+    return GENERATORS[generator](**settings)
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import random
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Spawn key of each stream, changing these changes every seeded floor
+MAP_STREAM = 0
+SPAWN_STREAM = 1
+AI_STREAM = 2
+
+
+class RandomStreams:
+    """
+    Independent seeded random number generators for parts of the game.
+
+    `map` lays out rooms and tunnels, `spawn` places monsters and items and
+    `ai` is rolled by monsters during play. Draws from one stream don't
+    shift the others, so changing how monsters spawn doesn't change the
+    layout of a floor.
+
+    `floor` returns the streams of one floor. They only depend on the seed
+    and the floor number, so a floor is the same however and whenever it
+    is generated.
+    """
+
+    def __init__(self, seed: Optional[int] = None, key: Tuple[int, ...] = ()):
+        self.seed = seed if seed is not None else random.getrandbits(32)
+        self.key = key
+
+        self.map = self._stream(MAP_STREAM)
+        self.spawn = self._stream(SPAWN_STREAM)
+        self.ai = self._stream(AI_STREAM)
+
+
+    def _stream(self, *stream: int) -> np.random.Generator:
+        return np.random.default_rng(
+            np.random.SeedSequence(self.seed, spawn_key=(*self.key, *stream))
+        )
+
+
+    def chunk(self, stream: int, chunk_x: int, chunk_y: int) -> np.random.Generator:
+        """
+        Return a new generator for one chunk of a map generated a chunk at
+        a time, from the spawn key of `stream`. It only depends on the seed
+        and the chunk's position, so chunks are the same whatever order
+        they are generated in.
+        """
+        return self._stream(stream, chunk_x, chunk_y)
+
+
+    def floor(self, floor: int) -> RandomStreams:
+        """Return new streams for generating the given floor"""
+        return RandomStreams(self.seed, (*self.key, floor))
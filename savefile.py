@@ -0,0 +1,932 @@
+"""
+The binary save format, for saved games and floors held in memory.
+
+A save is a header and a summary, then sections of raw bytes each aligned
+to ALIGNMENT, then a JSON section table. The header holds MAGIC,
+FORMAT_VERSION and where the section table is. The summary holds what a
+save menu shows, so it can be read without the rest of the save. The table
+gives each section's offset, size, dtype and shape, and holds the rest of
+the save's small values as `meta`.
+
+NumPy arrays are written as their raw buffers. When a save is loaded from
+a file they are copy-on-write views of one memory map of it, so they are
+only read from disk as they are used. Entities are stored as columnar
+tables of numbers, with string and JSON columns for the rest.
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+
+from chunked_array import ChunkedArray
+from components.ai import BaseAI, ConfusedEnemy, HostileEnemy
+from components import consumable
+from components.fighter import Fighter
+from components.inventory import Inventory
+from connectivity import Connectivity
+from engine import Engine
+from entity import Actor, Entity, Item
+from message_log import Message
+from render_order import RenderOrder
+from rng import RandomStreams
+import tile_types
+
+if TYPE_CHECKING:
+    from game_map import GameMap
+
+
+MAGIC = b"RLSAVE\x00\x00"
+# Increase when the layout changes, older saves are then refused
+FORMAT_VERSION = 3
+# Magic, format version, section table offset and size
+HEADER = struct.Struct("<8sIQQ")
+# Fields of SaveSummary, written after the header
+SUMMARY = struct.Struct("<IiiId")
+ALIGNMENT = 64
+
+# Messages read when a game is loaded, enough to fill the message log.
+# Older messages are read when they are first needed
+RECENT_MESSAGES = 16
+
+# Values of the entity table's `kind` column
+ENTITY_KIND, ACTOR_KIND, ITEM_KIND = 0, 1, 2
+
+# Components saved by type name in JSON columns
+COMPONENT_TYPES: Dict[str, type] = {
+    cls.__name__: cls
+    for cls in (
+        HostileEnemy,
+        ConfusedEnemy,
+        consumable.ConfustionConsumable,
+        consumable.HealingConsumable,
+        consumable.FireballDamageConsumable,
+        consumable.LightningDamageConsumable,
+    )
+}
+
+
+class SaveFormatError(Exception):
+    """Raised when data is not a save this version can read"""
+
+
+class SaveSummary(NamedTuple):
+    """What a save menu shows of a saved game, read by `read_summary`"""
+    floor: int
+    hp: int
+    max_hp: int
+    turn: int
+    # Unix time the game was saved at
+    saved_at: float
+
+
+def _check_header(data: bytes) -> Tuple[int, int]:
+    """Check the header at the start of `data` and return the section table's offset and size"""
+    if len(data) < HEADER.size:
+        raise SaveFormatError("Not a save file")
+    magic, version, offset, size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise SaveFormatError("Not a save file")
+    if version != FORMAT_VERSION:
+        raise SaveFormatError(
+            f"Save format version {version} is not supported, expected {FORMAT_VERSION}"
+        )
+    return offset, size
+
+
+def _save_files(filename: str) -> List[Tuple[int, str]]:
+    """Return the generation and path of each file of the save `filename`, newest first"""
+    stem, ext = os.path.splitext(filename)
+    directory = os.path.dirname(stem)
+    prefix = os.path.basename(stem) + "."
+    try:
+        names = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return []
+    files = []
+    for name in names:
+        generation = name[len(prefix):len(name) - len(ext)]
+        if name.startswith(prefix) and name.endswith(ext) and generation.isdigit():
+            files.append((int(generation), os.path.join(directory, name)))
+    return sorted(files, reverse=True)
+
+
+def save_path(filename: str) -> str:
+    """
+    Return the file holding the latest write of the save `filename`.
+    Raises FileNotFoundError if it hasn't been saved.
+    """
+    files = _save_files(filename)
+    if not files:
+        raise FileNotFoundError(f"No save {filename!r}")
+    return files[0][1]
+
+
+def read_summary(filename: str) -> SaveSummary:
+    """
+    Return the summary of the save `filename`, reading only its header.
+    Raises SaveFormatError if it isn't a save this version can load,
+    or is shorter than its header says.
+    """
+    with open(save_path(filename), "rb") as f:
+        data = f.read(HEADER.size + SUMMARY.size)
+        offset, size = _check_header(data)
+        if len(data) < HEADER.size + SUMMARY.size or os.fstat(f.fileno()).st_size < offset + size:
+            raise SaveFormatError("Save file is cut short")
+    return SaveSummary(*SUMMARY.unpack_from(data, HEADER.size))
+
+
+class SaveWriter:
+    """
+    Collects the sections of a save and its `meta`, then `write` writes them.
+    Arrays are copied as they are added, so a writer holds a snapshot which
+    can be written while the game carries on.
+    """
+
+    def __init__(self) -> None:
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.meta: Dict[str, Any] = {}
+        # Written as zeros if not set, as for floors held in memory
+        self.summary: Optional[SaveSummary] = None
+
+
+    def _add(self, name: str, array: np.ndarray) -> None:
+        if name in self.arrays:
+            raise ValueError(f"Duplicate save section {name!r}")
+        self.arrays[name] = array
+
+
+    def add_array(self, name: str, array: np.ndarray) -> None:
+        """Add a copy of an array, Fortran ordered arrays stay that way"""
+        self._add(name, np.array(array, order="K"))
+
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        self._add(name, np.frombuffer(bytes(data), dtype=np.uint8))
+
+
+    def add_strings(self, name: str, strings: Sequence[str]) -> None:
+        """Add a column of strings, as UTF-8 data and the offset of each string in it"""
+        encoded = [string.encode() for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        self._add(f"{name}.offsets", offsets)
+        self.add_bytes(f"{name}.data", b"".join(encoded))
+
+
+    def add_json(self, name: str, values: Sequence[Any]) -> None:
+        """Add a column of JSON values"""
+        self.add_strings(name, [json.dumps(value) for value in values])
+
+
+    def write(self, f: BinaryIO) -> None:
+        """Write the header and summary, the sections, then the section table with `meta`"""
+        start = f.tell()
+        f.write(bytes(HEADER.size))
+        f.write(SUMMARY.pack(*(self.summary or (0, 0, 0, 0, 0.0))))
+
+        def align() -> int:
+            offset = f.tell() - start
+            padding = -offset % ALIGNMENT
+            f.write(bytes(padding))
+            return offset + padding
+
+        sections = {}
+        for name, array in self.arrays.items():
+            fortran = array.ndim > 1 and array.flags.f_contiguous and not array.flags.c_contiguous
+            offset = align()
+            f.write(array.tobytes(order="F" if fortran else "C"))
+            sections[name] = {
+                "offset": offset,
+                "size": array.nbytes,
+                "dtype": array.dtype.str,
+                "shape": array.shape,
+                "order": "F" if fortran else "C",
+            }
+
+        table = json.dumps({"sections": sections, "meta": self.meta}).encode()
+        offset = align()
+        f.write(table)
+        end = f.tell()
+        f.seek(start)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, offset, len(table)))
+        f.seek(end)
+
+
+class SaveReader:
+    """
+    Reads the sections of a save from a buffer.
+    Arrays are views of the buffer, so they are only copied if it is
+    read-only or when they are written to, if it is a copy-on-write map.
+    """
+
+    def __init__(self, buffer: Union[bytes, bytearray, mmap.mmap]):
+        self.buffer = buffer
+        offset, size = _check_header(buffer[:HEADER.size])
+        if len(buffer) < offset + size:
+            raise SaveFormatError("Save file is cut short")
+        try:
+            table = json.loads(bytes(buffer[offset : offset + size]))
+            self.sections: Dict[str, Dict[str, Any]] = table["sections"]
+            self.meta: Dict[str, Any] = table["meta"]
+        except (ValueError, KeyError, TypeError) as exc:
+            raise SaveFormatError("Save file's section table is damaged") from exc
+
+
+    @classmethod
+    def open(cls, path: str) -> SaveReader:
+        """
+        Memory map a save file. The file mustn't be written over while it is
+        mapped. Raises SaveFormatError if it isn't a save this version can read.
+        """
+        with open(path, "rb") as f:
+            # Checked before mapping, an empty file can't be mapped
+            _check_header(f.read(HEADER.size))
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.sections
+
+
+    def array(self, name: str) -> np.ndarray:
+        section = self.sections[name]
+        array = np.ndarray(
+            tuple(section["shape"]),
+            dtype=np.dtype(section["dtype"]),
+            buffer=self.buffer,
+            offset=section["offset"],
+            order=section["order"],
+        )
+        return array if array.flags.writeable else array.copy(order="K")
+
+
+    def read_bytes(self, name: str) -> bytes:
+        return self.array(name).tobytes()
+
+
+    def strings(self, name: str, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Return a column of strings, or its rows from `start` up to `stop`"""
+        offsets = self.array(f"{name}.offsets")[start:None if stop is None else stop + 1].tolist()
+        if not offsets:
+            return []
+        first = offsets[0]
+        data = self.array(f"{name}.data")[first:offsets[-1]].tobytes()
+        return [
+            data[begin - first:end - first].decode() for begin, end in zip(offsets, offsets[1:])
+        ]
+
+
+    def json(self, name: str) -> List[Any]:
+        return [json.loads(string) for string in self.strings(name)]
+
+
+def _encode_component(component: Any) -> Optional[Dict[str, Any]]:
+    """Return the JSON state of an AI or consumable component, without its owner"""
+    if component is None:
+        return None
+    state: Dict[str, Any] = {"type": type(component).__name__}
+    for name, value in vars(component).items():
+        if name in ("parent", "entity"):
+            continue
+        if isinstance(value, BaseAI):
+            value = _encode_component(value)
+        state[name] = value
+    return state
+
+
+def _decode_value(value: Any) -> Any:
+    # JSON has no tuples, positions are saved as lists of numbers
+    if isinstance(value, list):
+        if value and all(isinstance(item, (int, float)) for item in value):
+            return tuple(value)
+        return [_decode_value(item) for item in value]
+    if isinstance(value, dict) and "type" in value:
+        return _decode_component(value, None)
+    return value
+
+
+def _decode_component(state: Optional[Dict[str, Any]], owner: Optional[Entity]) -> Any:
+    """Rebuild a component from `_encode_component` state, owned by `owner`"""
+    if state is None:
+        return None
+    state = dict(state)
+    cls = COMPONENT_TYPES.get(state.pop("type"))
+    if cls is None:
+        raise SaveFormatError("Unknown component type in save")
+    component = cls.__new__(cls)
+    for name, value in state.items():
+        setattr(component, name, _decode_value(value))
+    if isinstance(component, BaseAI):
+        component.entity = owner # type: ignore
+        if isinstance(component, ConfusedEnemy) and component.previous_ai is not None:
+            component.previous_ai.entity = owner # type: ignore
+    else:
+        component.parent = owner # type: ignore
+    return component
+
+
+def _write_entities(writer: SaveWriter, prefix: str, entities: Sequence[Entity]) -> None:
+    """
+    Add the entity, actor and item tables for the entities on a map and the
+    items in their inventories. Inventory items name their owner's row
+    """
+    rows: List[Entity] = list(entities)
+    owners = [-1] * len(rows)
+    for row, entity in enumerate(entities):
+        if isinstance(entity, Actor):
+            rows += entity.inventory.items
+            owners += [row] * len(entity.inventory.items)
+
+    writer.add_array(f"{prefix}entity.kind", np.array(
+        [ACTOR_KIND if isinstance(e, Actor) else ITEM_KIND if isinstance(e, Item) else ENTITY_KIND
+         for e in rows], dtype=np.uint8,
+    ))
+    writer.add_array(f"{prefix}entity.position", np.array(
+        [(e.x, e.y) for e in rows], dtype=np.int32).reshape(-1, 2)
+    )
+    writer.add_array(f"{prefix}entity.char", np.array([ord(e.char) for e in rows], dtype=np.int32))
+    writer.add_array(f"{prefix}entity.color", np.array(
+        [e.color for e in rows], dtype=np.uint8).reshape(-1, 3)
+    )
+    writer.add_strings(f"{prefix}entity.name", [e.name for e in rows])
+    writer.add_array(f"{prefix}entity.blocks_movement", np.array(
+        [e.blocks_movement for e in rows], dtype=bool
+    ))
+    writer.add_array(f"{prefix}entity.render_order", np.array(
+        [e.render_order.value for e in rows], dtype=np.uint8
+    ))
+    writer.add_array(f"{prefix}entity.owner", np.array(owners, dtype=np.int32))
+
+    actors = [(row, e) for row, e in enumerate(rows) if isinstance(e, Actor)]
+    writer.add_array(f"{prefix}actor.entity", np.array([row for row, _ in actors], dtype=np.int32))
+    writer.add_array(f"{prefix}actor.stats", np.array(
+        [
+            (a.speed, a.fighter.max_hp, a.fighter.hp, a.fighter.defense,
+             a.fighter.power, a.inventory.capacity)
+            for _, a in actors
+        ], dtype=np.int32,
+    ).reshape(-1, 6))
+    writer.add_json(f"{prefix}actor.ai", [_encode_component(a.ai) for _, a in actors])
+
+    items = [(row, e) for row, e in enumerate(rows) if isinstance(e, Item)]
+    writer.add_array(f"{prefix}item.entity", np.array([row for row, _ in items], dtype=np.int32))
+    writer.add_json(f"{prefix}item.consumable", [_encode_component(i.consumable) for _, i in items])
+
+
+def _read_entities(reader: SaveReader, prefix: str) -> Tuple[List[Entity], np.ndarray]:
+    """
+    Return every entity from `_write_entities` by row, with inventory items
+    already in their owner's inventory, and the owner column
+    """
+    kinds = reader.array(f"{prefix}entity.kind").tolist()
+    positions = reader.array(f"{prefix}entity.position").tolist()
+    chars = reader.array(f"{prefix}entity.char").tolist()
+    colors = reader.array(f"{prefix}entity.color").tolist()
+    names = reader.strings(f"{prefix}entity.name")
+    blocks = reader.array(f"{prefix}entity.blocks_movement").tolist()
+    render_orders = reader.array(f"{prefix}entity.render_order").tolist()
+    owners = reader.array(f"{prefix}entity.owner")
+
+    classes = {ENTITY_KIND: Entity, ACTOR_KIND: Actor, ITEM_KIND: Item}
+    rows: List[Entity] = []
+    for kind, (x, y), char, entity_color, name, blocks_movement, render_order in zip(
+        kinds, positions, chars, colors, names, blocks, render_orders
+    ):
+        # Built without __init__, which would make fresh components
+        entity = classes[kind].__new__(classes[kind])
+        entity.x, entity.y = x, y
+        entity.char = chr(char)
+        entity.color = tuple(entity_color) # type: ignore
+        entity.name = name
+        entity.blocks_movement = blocks_movement
+        entity.render_order = RenderOrder(render_order)
+        rows.append(entity)
+
+    actor_rows = reader.array(f"{prefix}actor.entity").tolist()
+    stats = reader.array(f"{prefix}actor.stats").tolist()
+    for row, (speed, max_hp, hp, defense, power, capacity), ai in zip(
+        actor_rows, stats, reader.json(f"{prefix}actor.ai")
+    ):
+        actor = rows[row]
+        assert isinstance(actor, Actor)
+        actor.speed = speed
+        fighter = Fighter(hp=max_hp, defense=defense, power=power)
+        fighter._hp = hp
+        fighter.parent = actor
+        actor.fighter = fighter
+        actor.inventory = Inventory(capacity=capacity)
+        actor.inventory.parent = actor
+        actor.ai = _decode_component(ai, actor)
+
+    item_rows = reader.array(f"{prefix}item.entity").tolist()
+    for row, state in zip(item_rows, reader.json(f"{prefix}item.consumable")):
+        item = rows[row]
+        assert isinstance(item, Item)
+        item.consumable = _decode_component(state, item)
+
+    for row, owner in enumerate(owners.tolist()):
+        if owner >= 0:
+            inventory = rows[owner].inventory # type: ignore
+            rows[row].parent = inventory
+            inventory.items.append(rows[row])
+    return rows, owners
+
+
+def _write_map_array(
+        writer: SaveWriter, name: str, array: Union[np.ndarray, ChunkedArray]
+) -> None:
+    """Add a map array, or the chunks which have been made of a chunked one"""
+    if isinstance(array, ChunkedArray):
+        keys = list(array.chunks)
+        writer.add_array(f"{name}.chunk_keys", np.array(keys, dtype=np.int32).reshape(-1, 2))
+        # Stacked on the last axis, so each chunk is a Fortran ordered block
+        chunks = np.empty((array.chunk_size, array.chunk_size, len(keys)), array.dtype, order="F")
+        for i, key in enumerate(keys):
+            chunks[:, :, i] = array.chunks[key]
+        writer.add_array(f"{name}.chunks", chunks)
+    else:
+        writer.add_array(name, array)
+
+
+def _read_map_array(
+        reader: SaveReader, name: str, array: Union[np.ndarray, ChunkedArray]
+) -> Union[np.ndarray, ChunkedArray]:
+    """Return a saved map array in place of the new `array`"""
+    if not isinstance(array, ChunkedArray):
+        return reader.array(name)
+    chunks = reader.array(f"{name}.chunks")
+    for i, (chunk_x, chunk_y) in enumerate(reader.array(f"{name}.chunk_keys").tolist()):
+        array.chunks[chunk_x, chunk_y] = chunks[:, :, i]
+    return array
+
+
+def _encode_tile_generator(game_map: GameMap) -> Optional[Dict[str, Any]]:
+    from procgen import CaveChunks
+
+    generator = getattr(game_map.tiles, "generate", None)
+    if generator is None:
+        return None
+    if isinstance(generator, CaveChunks):
+        return {
+            "type": "CaveChunks",
+            "seed": generator.rng.seed,
+            "key": list(generator.rng.key),
+            "map_width": generator.map_width,
+            "map_height": generator.map_height,
+            "chunk_size": generator.chunk_size,
+        }
+    raise TypeError(f"Can't save chunks generated by {generator!r}")
+
+
+def _decode_tile_generator(state: Optional[Dict[str, Any]]) -> Any:
+    from procgen import CaveChunks
+
+    if state is None:
+        return None
+    if state["type"] != "CaveChunks":
+        raise SaveFormatError("Unknown tile generator in save")
+    return CaveChunks(
+        RandomStreams(state["seed"], tuple(state["key"])),
+        state["map_width"],
+        state["map_height"],
+        state["chunk_size"],
+    )
+
+
+def write_floor(
+        writer: SaveWriter, prefix: str, game_map: GameMap, engine: Engine, with_player: bool
+) -> Dict[str, Any]:
+    """
+    Add the sections of a floor under `prefix` and return its meta.
+    The player is left out unless `with_player` is set.
+    """
+    entities = [
+        entity for entity in game_map.entities
+        if with_player or entity is not engine.player
+    ]
+    _write_entities(writer, prefix, entities)
+    scheduler = game_map.scheduler
+    keys = [
+        scheduler.key_of(entity) if isinstance(entity, Actor) else None
+        for entity in entities
+    ]
+    writer.add_array(f"{prefix}schedule", np.array(
+        [key if key is not None else (-1, -1) for key in keys], dtype=np.int64
+    ).reshape(-1, 2))
+    rows = {entity: row for row, entity in enumerate(entities)}
+    # Rows of the dormant actors, in the order they fell dormant
+    writer.add_array(f"{prefix}dormant", np.array(
+        [rows[actor] for actor in scheduler.dormant], dtype=np.int64
+    ))
+
+    _write_map_array(writer, f"{prefix}tiles", game_map.tiles)
+    _write_map_array(writer, f"{prefix}visible", game_map.visible)
+    _write_map_array(writer, f"{prefix}explored", game_map.explored)
+
+    return {
+        "width": game_map.width,
+        "height": game_map.height,
+        "chunk_size": game_map.chunk_size,
+        "tile_generator": _encode_tile_generator(game_map),
+        "entity_count": len(entities),
+        "player": entities.index(engine.player) if engine.player in entities else None,
+        "scheduler": [scheduler.time, scheduler.counter],
+        "tiles_version": game_map.tiles_version,
+        "fov_window": [
+            [game_map.fov_window[0].start, game_map.fov_window[0].stop],
+            [game_map.fov_window[1].start, game_map.fov_window[1].stop],
+        ],
+        "fov_key": game_map.fov_key,
+        "downstairs": game_map.downstairs_location,
+        "upstairs": game_map.upstairs_location,
+        "room_count": game_map.room_count,
+        "connectivity": game_map.connectivity,
+    }
+
+
+def read_floor(
+        reader: SaveReader,
+        prefix: str,
+        meta: Dict[str, Any],
+        engine: Engine,
+        entities: Optional[List[Entity]] = None,
+) -> GameMap:
+    """
+    Rebuild a floor from `write_floor`, linked to `engine`.
+    `entities` may be given if they were already read with `_read_entities`.
+    """
+    from game_map import GameMap
+
+    if entities is None:
+        entities, owners = _read_entities(reader, prefix)
+    else:
+        owners = reader.array(f"{prefix}entity.owner")
+    game_map = GameMap(
+        engine,
+        meta["width"],
+        meta["height"],
+        chunk_size=meta["chunk_size"],
+        generate_tiles=_decode_tile_generator(meta["tile_generator"]),
+    )
+    game_map.tiles = _read_map_array(reader, f"{prefix}tiles", game_map.tiles)
+    if game_map.chunk_size is None:
+        game_map.walkable = tile_types.walkable_table[game_map.tiles]
+        game_map.transparent = tile_types.transparent_table[game_map.tiles]
+    game_map.visible = _read_map_array(reader, f"{prefix}visible", game_map.visible)
+    game_map.explored = _read_map_array(reader, f"{prefix}explored", game_map.explored)
+
+    on_map = [entity for entity, owner in zip(entities, owners.tolist()) if owner < 0]
+    for entity in on_map:
+        entity.parent = game_map
+        game_map.add_entity(entity)
+
+    keys = {}
+    schedule = reader.array(f"{prefix}schedule").tolist()
+    for entity, (time, order) in zip(on_map, schedule):
+        if order >= 0:
+            keys[entity] = (time, order)
+    dormant = [on_map[row] for row in reader.array(f"{prefix}dormant").tolist()]
+    game_map.scheduler.restore(*meta["scheduler"], keys, dormant) # type: ignore
+
+    game_map.tiles_version = meta["tiles_version"]
+    (x1, x2), (y1, y2) = meta["fov_window"]
+    game_map.fov_window = slice(x1, x2), slice(y1, y2)
+    game_map.fov_key = tuple(meta["fov_key"]) if meta["fov_key"] else None # type: ignore
+    game_map.downstairs_location = tuple(meta["downstairs"]) # type: ignore
+    game_map.upstairs_location = tuple(meta["upstairs"]) # type: ignore
+    game_map.room_count = meta["room_count"]
+    if meta["connectivity"] is not None:
+        game_map.connectivity = Connectivity(*meta["connectivity"])
+    return game_map
+
+
+class SavedFloor:
+    """
+    A stored floor of a loaded save, which is only read from the save
+    when it is first needed. Until then, saving it again or compressing
+    it copies its sections without building the floor.
+    """
+
+    def __init__(self, reader: SaveReader, prefix: str, meta: Dict[str, Any]):
+        self.reader = reader
+        self.prefix = prefix
+        self.meta = meta
+
+
+    def load(self, engine: Engine) -> GameMap:
+        return read_floor(self.reader, self.prefix, self.meta, engine)
+
+
+    def copy_to(self, writer: SaveWriter, prefix: str) -> Dict[str, Any]:
+        """Add this floor's sections to `writer` under `prefix` and return its meta"""
+        for name in self.reader.sections:
+            if name.startswith(self.prefix):
+                writer.add_array(prefix + name[len(self.prefix):], self.reader.array(name))
+        return self.meta
+
+
+    def dump(self) -> bytes:
+        """Return this floor as `dump_floor` would"""
+        writer = SaveWriter()
+        writer.meta["floor"] = self.copy_to(writer, "")
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+def dump_floor(game_map: GameMap, engine: Engine) -> bytes:
+    """Encode a floor without the player, for `load_floor` to link to an engine"""
+    writer = SaveWriter()
+    writer.meta["floor"] = write_floor(writer, "", game_map, engine, with_player=False)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def load_floor(data: bytes, engine: Engine) -> GameMap:
+    """Decode a floor from `dump_floor`, linking it to `engine`"""
+    # A bytearray makes the arrays writable views instead of copies
+    reader = SaveReader(bytearray(data))
+    return read_floor(reader, "", reader.meta["floor"], engine)
+
+
+def _rng_state(rng: RandomStreams) -> Dict[str, Any]:
+    return {
+        "seed": rng.seed,
+        "key": list(rng.key),
+        "map": rng.map.bit_generator.state,
+        "spawn": rng.spawn.bit_generator.state,
+        "ai": rng.ai.bit_generator.state,
+    }
+
+
+def _read_messages(reader: SaveReader, start: int, stop: int) -> List[Message]:
+    """Return the saved messages from `start` up to `stop`"""
+    messages = []
+    for text, fg, count in zip(
+        reader.strings("messages.text", start, stop),
+        reader.array("messages.fg")[start:stop].tolist(),
+        reader.array("messages.count")[start:stop].tolist(),
+    ):
+        message = Message(text, tuple(fg)) # type: ignore
+        message.count = count
+        messages.append(message)
+    return messages
+
+
+class SavedMessages:
+    """
+    The older messages of a loaded save, which the message log reads by
+    calling this when it first needs them. Until then, saving the log
+    copies their rows without reading them.
+    """
+
+    def __init__(self, reader: SaveReader, stop: int):
+        self.reader = reader
+        self.stop = stop
+
+
+    def __call__(self) -> List[Message]:
+        return _read_messages(self.reader, 0, self.stop)
+
+
+def _write_messages(
+        writer: SaveWriter, messages: Sequence[Message], older: Optional[SavedMessages] = None
+) -> None:
+    """
+    Add the columns of a message log's `messages`. The rows of `older`
+    messages which haven't been loaded are copied in before them.
+    """
+    encoded = [message.plain_text.encode() for message in messages]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    data = b"".join(encoded)
+    fg = np.array([message.fg for message in messages], dtype=np.uint8).reshape(-1, 3)
+    count = np.array([message.count for message in messages], dtype=np.int32)
+    if older is not None:
+        reader, stop = older.reader, older.stop
+        older_offsets = reader.array("messages.text.offsets")[:stop + 1]
+        offsets = np.concatenate([older_offsets, older_offsets[-1] + offsets[1:]])
+        data = reader.array("messages.text.data")[:older_offsets[-1]].tobytes() + data
+        fg = np.concatenate([reader.array("messages.fg")[:stop], fg])
+        count = np.concatenate([reader.array("messages.count")[:stop], count])
+    writer.add_array("messages.text.offsets", offsets)
+    writer.add_bytes("messages.text.data", data)
+    writer.add_array("messages.fg", fg)
+    writer.add_array("messages.count", count)
+
+
+def snapshot_engine(engine: Engine) -> SaveWriter:
+    """
+    Return a writer holding a copy of a game, for `write_save` to write.
+    Take it between turns so the game is in a consistent state.
+    """
+    world = engine.game_world
+    writer = SaveWriter()
+    current = write_floor(writer, "floor/", engine.game_map, engine, with_player=True)
+
+    stored = []
+    for floor, game_map in world.floors.stored_floors():
+        if isinstance(game_map, bytes):
+            writer.add_bytes(f"stored/{floor}", game_map)
+            stored.append({"floor": floor, "compressed": True})
+        elif isinstance(game_map, SavedFloor):
+            stored.append({
+                "floor": floor,
+                "compressed": False,
+                "meta": game_map.copy_to(writer, f"stored/{floor}/"),
+            })
+        else:
+            stored.append({
+                "floor": floor,
+                "compressed": False,
+                "meta": write_floor(writer, f"stored/{floor}/", game_map, engine, False),
+            })
+
+    load_older, messages = engine.message_log.loaded_messages()
+    if isinstance(load_older, SavedMessages):
+        _write_messages(writer, messages, load_older)
+    else:
+        _write_messages(writer, engine.message_log.messages)
+
+    writer.summary = SaveSummary(
+        floor=world.current_floor,
+        hp=engine.player.fighter.hp,
+        max_hp=engine.player.fighter.max_hp,
+        turn=engine.turn,
+        saved_at=time.time(),
+    )
+    writer.meta.update({
+        "rng": _rng_state(engine.rng),
+        "mouse_location": engine.mouse_location,
+        "turn": engine.turn,
+        "world": {
+            "map_width": world.map_width,
+            "map_height": world.map_height,
+            "max_rooms": world.max_rooms,
+            "room_min_size": world.room_min_size,
+            "room_max_size": world.room_max_size,
+            "max_monsters_per_room": world.max_monsters_per_room,
+            "max_items_per_room": world.max_items_per_room,
+            "current_floor": world.current_floor,
+            "generator": world.generator,
+            "max_live_floors": world.floors.max_live_floors,
+            "floor_memory_budget": world.floors.memory_budget,
+            "prefetch_floors": world.prefetcher is not None,
+        },
+        "floor": current,
+        "stored": stored,
+    })
+    return writer
+
+
+def remove_save(filename: str) -> None:
+    """Remove every file of the save `filename`, and its journal"""
+    from journal import journal_path
+
+    paths = [path for _, path in _save_files(filename)]
+    for path in paths + [journal_path(filename)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_save(writer: SaveWriter, filename: str) -> None:
+    """
+    Write a snapshot to the save `filename`.
+
+    Each write goes to a new file, `filename` with a generation number
+    before its extension, so the file a loaded game has memory mapped is
+    never written over or replaced. The new file is synced before older
+    ones are removed, so a crash part way through leaves the last save
+    whole. Systems which can't remove a mapped file keep it until a later
+    save, once it is no longer mapped.
+    """
+    files = _save_files(filename)
+    generation = files[0][0] + 1 if files else 0
+    stem, ext = os.path.splitext(filename)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(prefix=".save_", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, f"{stem}.{generation}{ext}")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    for _, path in files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def save_engine(engine: Engine, filename: str) -> None:
+    """Save a game to `filename`"""
+    write_save(snapshot_engine(engine), filename)
+
+
+class BackgroundSaver:
+    """
+    Writes saves on a worker thread, so play carries on while they are written.
+    `save` snapshots the game straight away, which is cheap next to writing
+    it. Saves are written one at a time in order, and a snapshot still
+    waiting when a newer one is taken is dropped.
+    """
+
+    def __init__(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+        self._pending: List[Future[None]] = []
+
+
+    def save(self, engine: Engine, filename: str) -> Future[None]:
+        """Snapshot `engine` and write it to `filename` in the background"""
+        writer = snapshot_engine(engine)
+        for future in self._pending:
+            future.cancel()
+        future = self._executor.submit(write_save, writer, filename)
+        self._pending.append(future)
+        self._check()
+        return future
+
+
+    def _check(self) -> None:
+        """Forget finished saves, raising the error of any that failed"""
+        done = [future for future in self._pending if future.done()]
+        self._pending = [future for future in self._pending if not future.done()]
+        for future in done:
+            if not future.cancelled():
+                future.result()
+
+
+    def wait(self) -> None:
+        """Block until every save has been written"""
+        wait(self._pending)
+        self._check()
+
+
+    def close(self) -> None:
+        """Wait for the last save, then stop the worker"""
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
+
+
+def load_engine(filename: str) -> Engine:
+    """
+    Load a game saved by `save_engine`. Only the current floor and the
+    latest messages are read, stored floors and older messages are read
+    from the save when they are first needed.
+    """
+    from game_map import GameWorld
+
+    reader = SaveReader.open(save_path(filename))
+    meta = reader.meta
+    floor_meta = meta["floor"]
+    if floor_meta["player"] is None:
+        raise SaveFormatError("Save has no player")
+
+    entities, _ = _read_entities(reader, "floor/")
+    player = entities[floor_meta["player"]]
+    assert isinstance(player, Actor)
+
+    rng_state = meta["rng"]
+    engine = Engine(player=player, seed=rng_state["seed"])
+    engine.rng = RandomStreams(rng_state["seed"], tuple(rng_state["key"]))
+    engine.rng.map.bit_generator.state = rng_state["map"]
+    engine.rng.spawn.bit_generator.state = rng_state["spawn"]
+    engine.rng.ai.bit_generator.state = rng_state["ai"]
+    engine.mouse_location = tuple(meta["mouse_location"]) # type: ignore
+    engine.turn = engine.last_autosave = meta.get("turn", 0)
+
+    engine.game_world = GameWorld(engine=engine, **meta["world"])
+    engine.game_map = read_floor(reader, "floor/", floor_meta, engine, entities)
+    for stored in meta["stored"]:
+        floor = stored["floor"]
+        if stored["compressed"]:
+            engine.game_world.floors.restore(floor, reader.read_bytes(f"stored/{floor}"))
+        else:
+            engine.game_world.floors.restore(
+                floor, SavedFloor(reader, f"stored/{floor}/", stored["meta"])
+            )
+
+    count = len(reader.array("messages.count"))
+    split = max(count - RECENT_MESSAGES, 0)
+    engine.message_log.restore(
+        _read_messages(reader, split, count),
+        SavedMessages(reader, split) if split else None,
+    )
+    return engine
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from entity import Actor
+
+
+# Time units an actor at NORMAL_SPEED needs for one action
+ACTION_COST = 100
+NORMAL_SPEED = 100
+
+
+class TurnScheduler:
+    """
+    Orders the actors of a map by the time of their next action.
+
+    Faster actors are rescheduled sooner and so act more often.
+    Actors due at the same time act in the order they were scheduled,
+    which keeps turn order the same between runs.
+
+    Dormant actors are kept off the schedule until they are woken.
+    """
+
+    def __init__(self) -> None:
+        self.time = 0
+        self._queue: List[Tuple[int, int, Actor]] = []
+        # Current (time, order) key of each scheduled actor
+        # Queue entries which don't match are stale and skipped
+        self._keys: Dict[Actor, Tuple[int, int]] = {}
+        self._counter = 0
+        # Used as a set which keeps the order actors fell dormant in,
+        # so they are woken in the same order every run
+        self.dormant: Dict[Actor, None] = {}
+
+
+    def __contains__(self, actor: Actor) -> bool:
+        return actor in self._keys
+
+
+    @staticmethod
+    def action_delay(actor: Actor) -> int:
+        """Return how long it takes the actor to perform one action"""
+        return ACTION_COST * NORMAL_SPEED // actor.speed
+
+
+    def schedule(self, actor: Actor, delay: int = 0) -> None:
+        """
+        Schedule the actor to act `delay` time units from now.
+        Replaces any time the actor was already scheduled for.
+        """
+        self._counter += 1
+        key = (self.time + delay, self._counter)
+        self._keys[actor] = key
+        heapq.heappush(self._queue, (*key, actor))
+
+
+    def unschedule(self, actor: Actor) -> None:
+        """Remove the actor from the schedule, if it is scheduled or dormant"""
+        self._keys.pop(actor, None)
+        self.dormant.pop(actor, None)
+
+
+    def sleep(self, actor: Actor) -> None:
+        """Make the actor dormant, it will not act until woken"""
+        self._keys.pop(actor, None)
+        self.dormant[actor] = None
+
+
+    def wake(self, actor: Actor) -> None:
+        """Return a dormant actor to the schedule, it acts after one action delay"""
+        if actor in self.dormant:
+            del self.dormant[actor]
+            self.schedule(actor, self.action_delay(actor))
+
+
+    @property
+    def counter(self) -> int:
+        """Number of times actors have been scheduled, the order part of their keys"""
+        return self._counter
+
+
+    def key_of(self, actor: Actor) -> Optional[Tuple[int, int]]:
+        """Return the (time, order) the actor is scheduled at, or None if it isn't"""
+        return self._keys.get(actor)
+
+
+    def restore(
+            self,
+            time: int,
+            counter: int,
+            keys: Dict[Actor, Tuple[int, int]],
+            dormant: Iterable[Actor],
+    ) -> None:
+        """Replace the schedule with one from `key_of` and `dormant`, as when loading a save"""
+        self.time = time
+        self._counter = counter
+        self._keys = dict(keys)
+        self._queue = [(*key, actor) for actor, key in self._keys.items()]
+        heapq.heapify(self._queue)
+        self.dormant = dict.fromkeys(dormant)
+
+
+    def peek(self) -> Optional[Actor]:
+        """Return the next actor to act without removing it"""
+        while self._queue:
+            time, order, actor = self._queue[0]
+            if self._keys.get(actor) == (time, order):
+                return actor
+            heapq.heappop(self._queue) # Discard stale entry
+        return None
+
+
+    def pop(self) -> Optional[Actor]:
+        """Remove and return the next actor to act, advancing the time to its turn"""
+        actor = self.peek()
+        if actor is not None:
+            self.time, _, _ = heapq.heappop(self._queue)
+            del self._keys[actor]
+        return actor
@@ -2,10 +2,10 @@
 from __future__ import annotations
 
 import copy
-import lzma
-import pickle
+import os
+import time
 import traceback
-from typing import Optional
+from typing import List, Optional, Union
 
 import tcod
 from tcod import libtcodpy
@@ -15,8 +15,14 @@ from engine import Engine
 import entity_factories
 from game_map import GameWorld
 import input_handlers
+import journal
+from savefile import SaveFormatError, SaveSummary, load_engine, read_summary, save_engine
 
 
+# Directory the save slots are kept in
+SAVE_DIRECTORY = "saves"
+SAVE_SLOTS = 10
+
 # Load bg image and remove alpha channel
 background_image = tcod.image.load("BG_full.png")[:, :, :3]
 
@@ -29,10 +35,14 @@ def new_game() -> Engine:
     room_max_size = 10
     room_min_size = 6
     max_rooms = 30
+    generator = "rooms"
 
     max_monsters_per_room = 2
     max_items_per_room = 2
 
+    max_live_floors = 3
+    floor_memory_budget = 16 * 1024 * 1024
+
     starting_floor = 0
 
     player = copy.deepcopy(entity_factories.player)
@@ -41,6 +51,7 @@ def new_game() -> Engine:
 
     engine.game_world = GameWorld(
         engine=engine,
+        generator=generator,
         max_rooms=max_rooms,
         room_min_size=room_min_size,
         room_max_size=room_max_size,
@@ -49,6 +60,8 @@ def new_game() -> Engine:
         max_monsters_per_room=max_monsters_per_room,
         max_items_per_room=max_items_per_room,
         current_floor=starting_floor,
+        max_live_floors=max_live_floors,
+        floor_memory_budget=floor_memory_budget,
     )
     engine.game_world.generate_floor()
     engine.update_fov()
@@ -60,11 +73,65 @@ def new_game() -> Engine:
     return engine
 
 
+def slot_path(slot: int) -> str:
+    """Return the file of a save slot"""
+    return os.path.join(SAVE_DIRECTORY, f"slot{slot}.sav")
+
+
+def read_slots() -> List[Union[SaveSummary, str, None]]:
+    """
+    Return the summary of each slot's save, None for an empty slot, or why
+    a slot's save can't be loaded. Only the headers of the saves are read.
+    """
+    slots: List[Union[SaveSummary, str, None]] = []
+    for slot in range(SAVE_SLOTS):
+        try:
+            slots.append(read_summary(slot_path(slot)))
+        except FileNotFoundError:
+            slots.append(None)
+        except (OSError, SaveFormatError) as exc:
+            slots.append(str(exc))
+    return slots
+
+
+def describe_slot(summary: Union[SaveSummary, str, None]) -> str:
+    """Return a line for a slot from `read_slots` in a save menu"""
+    if summary is None:
+        return "(empty)"
+    if isinstance(summary, str):
+        return f"(can't load: {summary})"
+    saved_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(summary.saved_at))
+    return (
+        f"Floor {summary.floor}  HP {summary.hp}/{summary.max_hp}"
+        f"  Turn {summary.turn}  {saved_at}"
+    )
+
+
+def new_game_in_slot(slot: int) -> Engine:
+    """Start a new game saved to `slot`, replacing any game saved there"""
+    engine = new_game()
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    engine.save_filename = slot_path(slot)
+    save_engine(engine, engine.save_filename)
+    engine.journal = journal.Journal.create(journal.journal_path(engine.save_filename), engine)
+    return engine
+
+
 def load_game(filename: str) -> Engine:
-    """Load an Engine instance from a file."""
-    with open(filename, "rb") as f:
-        engine = pickle.loads(lzma.decompress(f.read()))
-    assert isinstance(engine, Engine)
+    """
+    Load an Engine instance from a file, then replay the turns its journal
+    recorded after it was saved and carry on journaling.
+    """
+    engine = load_engine(filename)
+    engine.save_filename = filename
+    path = journal.journal_path(filename)
+    records = journal.replay(path, engine)
+    if records:
+        engine.message_log.add_message(
+            f"Recovered {len(records) // journal.RECORD.size} turns since the last save.",
+            color.welcome_text,
+        )
+    engine.journal = journal.Journal.create(path, engine, records)
     return engine
 
 
@@ -92,7 +159,7 @@ class MainMenu(input_handlers.BaseEventHandler):
 
         menu_width = 24
         for i, text in enumerate(
-            ["[N] Start a new game","[C] Continue last game","[Q] Quit"]
+            ["[N] Start a new game","[C] Continue last game","[L] Load a game","[Q] Quit"]
         ):
             console.print(
                 console.width // 2,
@@ -110,14 +177,109 @@ class MainMenu(input_handlers.BaseEventHandler):
         if event.sym in (tcod.event.KeySym.q, tcod.event.KeySym.ESCAPE):
             raise SystemExit()
         elif event.sym == tcod.event.KeySym.c:
-            try:
-                return input_handlers.MainGameEventHandler(load_game("savegame.sav"))
-            except FileNotFoundError:
+            # Continue the most recently saved game
+            saved = [
+                (summary.saved_at, slot)
+                for slot, summary in enumerate(read_slots())
+                if isinstance(summary, SaveSummary)
+            ]
+            if not saved:
                 return input_handlers.PopupMessage(self, "No saved game to load.")
-            except Exception as exc:
-                traceback.print_exc() # Print to stderr
-                return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
+            return self.load(max(saved)[1])
+        elif event.sym == tcod.event.KeySym.l:
+            return SlotMenu(self, new_game=False)
         elif event.sym == tcod.event.KeySym.n:
-            return input_handlers.MainGameEventHandler(new_game())
+            return SlotMenu(self, new_game=True)
         
         return None
+
+    def load(self, slot: int) -> input_handlers.BaseEventHandler:
+        """Load the game in a slot, or show why it can't be loaded"""
+        try:
+            engine = load_game(slot_path(slot))
+        except FileNotFoundError:
+            return input_handlers.PopupMessage(self, "No saved game to load.")
+        except SaveFormatError as exc:
+            return input_handlers.PopupMessage(self, f"Can't load save:\n{exc}")
+        except Exception as exc:
+            traceback.print_exc() # Print to stderr
+            return input_handlers.PopupMessage(self, f"Failed to load save:\n{exc}")
+        if not engine.player.is_alive:
+            # The player died in the turns replayed from the journal
+            return input_handlers.GameOverEventHandler(engine)
+        return input_handlers.MainGameEventHandler(engine)
+
+
+class SlotMenu(input_handlers.BaseEventHandler):
+    """
+    List the save slots to start a new game in or load a game from.
+    The slots are described from the headers of their saves.
+    """
+
+    def __init__(self, parent: MainMenu, new_game: bool):
+        self.parent = parent
+        self.new_game = new_game
+        self.slots = read_slots()
+
+    def on_render(self, console: tcod.console.Console) -> None:
+        """Render the slots over the main menu"""
+        self.parent.on_render(console)
+        if self.new_game:
+            title = "Choose a slot for the new game"
+        else:
+            title = "Choose a game to load"
+
+        width = 64
+        height = len(self.slots) + 2
+        x = (console.width - width) // 2
+        y = (console.height - height) // 2
+        console.draw_frame(
+            x=x,
+            y=y,
+            width=width,
+            height=height,
+            title=title,
+            clear=True,
+            fg=(255, 255, 255),
+            bg=(0, 0, 0),
+        )
+        for i, summary in enumerate(self.slots):
+            slot_key = chr(ord("a") + i)
+            text = f"({slot_key}) {describe_slot(summary)}"
+            console.print(x + 1, y + i + 1, text[:width - 2])
+
+    def ev_keydown(
+        self, event: tcod.event.KeyDown
+    ) -> Optional[input_handlers.BaseEventHandler]:
+        if event.sym == tcod.event.KeySym.ESCAPE:
+            return self.parent
+        index = event.sym - tcod.event.KeySym.a
+        if not 0 <= index < len(self.slots):
+            return None
+        summary = self.slots[index]
+        if self.new_game:
+            if isinstance(summary, SaveSummary):
+                return ConfirmOverwrite(self, index, summary)
+            return input_handlers.MainGameEventHandler(new_game_in_slot(index))
+        if not isinstance(summary, SaveSummary):
+            return None # Nothing in the slot to load
+        return self.parent.load(index)
+
+
+class ConfirmOverwrite(input_handlers.PopupMessage):
+    """Ask before a new game replaces the game saved in a slot"""
+
+    def __init__(self, parent: SlotMenu, slot: int, summary: SaveSummary):
+        super().__init__(
+            parent,
+            f"Replace the game in slot ({chr(ord('a') + slot)})?\n"
+            f"{describe_slot(summary)}\n\n[Y] Yes  [N] No",
+        )
+        self.slot = slot
+
+    def ev_keydown(
+        self, event: tcod.event.KeyDown
+    ) -> Optional[input_handlers.BaseEventHandler]:
+        if event.sym == tcod.event.KeySym.y:
+            return input_handlers.MainGameEventHandler(new_game_in_slot(self.slot))
+        return self.parent
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 
@@ -21,6 +21,9 @@ tile_dt = np.dtype(
     ]
 )
 
+# Registered tile types, a tile's ID is its index in this list
+_tiles: List[np.ndarray] = []
+
 
 def new_tile(
         *, # Enforce use of keywords so parameter order does not matter
@@ -28,9 +31,13 @@ def new_tile(
         transparent: int,
         dark: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
         light: Tuple[int, Tuple[int, int, int], Tuple[int, int, int]],
-) -> np.ndarray:
-    """Helper function for defining individual tyle types"""
-    return np.array((walkable, transparent, dark, light), dtype=tile_dt)
+) -> int:
+    """
+    Helper function for defining individual tyle types
+    Returns the ID maps use to store this tile
+    """
+    _tiles.append(np.array((walkable, transparent, dark, light), dtype=tile_dt))
+    return len(_tiles) - 1
 
 # SHROUD represents unexplored, unseen tiles
 SHROUD = np.array((ord(" "), (255, 255, 255), (0, 0, 0)), dtype=grapic_dt)
@@ -55,3 +62,18 @@ down_stairs = new_tile(
     dark=(ord(">"), (0, 0, 100), (50, 50, 150)),
     light=(ord(">"), (255, 255, 255), (200, 180, 50))
 )
+
+up_stairs = new_tile(
+    walkable=True,
+    transparent=True,
+    dark=(ord("<"), (0, 0, 100), (50, 50, 150)),
+    light=(ord("<"), (255, 255, 255), (200, 180, 50))
+)
+
+
+# Lookup tables indexed by tile ID
+tile_table = np.array(_tiles, dtype=tile_dt)
+walkable_table = np.ascontiguousarray(tile_table["walkable"])
+transparent_table = np.ascontiguousarray(tile_table["transparent"])
+dark_table = np.ascontiguousarray(tile_table["dark"])
+light_table = np.ascontiguousarray(tile_table["light"])